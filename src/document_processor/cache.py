@@ -0,0 +1,207 @@
+"""
+Extraction Cache Module
+Disk-backed, content-addressable cache of Gemini extraction results
+"""
+
+import os
+import copy
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# orjson reads and writes entries several times faster; stdlib json is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+# Bump whenever the extraction prompts change so stale results are not served
+PROMPT_VERSION = "v1"
+
+# Writes between sweeps of the cache directory for expired and excess entries
+PURGE_INTERVAL = 100
+
+
+class ExtractionCache:
+    """
+    Stores extraction results under data/gemini_cache/{hash[:2]}/{hash}.json
+
+    Recently used entries are also kept in an in-process LRU, so repeat
+    submissions skip the disk read and JSON parse as well as the Gemini call.
+
+    Entries hold extracted personal data in plain JSON. The directory is
+    swept on startup and every PURGE_INTERVAL writes, removing entries past
+    their TTL and the oldest ones beyond max_entries.
+    """
+
+    def __init__(self, cache_dir: str = "data/gemini_cache", ttl_days: int = 7, memory_entries: int = 256,
+                 max_entries: int = 10000):
+        """
+        Initialize extraction cache
+
+        Args:
+            cache_dir: Directory for cache entries
+            ttl_days: Days before an entry is considered stale
+            memory_entries: Entries kept in memory in front of the disk cache (0 disables)
+            max_entries: Entries kept on disk before the oldest are purged (0 disables the cap)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._writes_since_purge = 0
+        self._purge_lock = threading.Lock()
+        self.purge()
+
+    @staticmethod
+    def make_key(model_name: str, document_type: Optional[str], content: bytes) -> str:
+        """
+        Build cache key from model, prompt version, document type and file content
+
+        Each part is length-prefixed so different splits of the same bytes never collide.
+        """
+        hasher = hashlib.sha256()
+        parts = (
+            (model_name or "").encode(),
+            PROMPT_VERSION.encode(),
+            (document_type or "auto").encode(),
+            content,
+        )
+        for part in parts:
+            hasher.update(len(part).to_bytes(8, "big"))
+            hasher.update(part)
+        return hasher.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        """Keep entry in the in-memory LRU, evicting the least recently used"""
+        if self.memory_entries <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached result for key, or None on miss or expiry"""
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is not None:
+            if time.time() - entry["created_at"] <= self.ttl_seconds:
+                # Callers get their own copy so they cannot alter the cached result
+                return copy.deepcopy(entry["result"])
+            with self._memory_lock:
+                self._memory.pop(key, None)
+
+        path = self._entry_path(key)
+        try:
+            entry = _json_loads(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path.name}: {e}")
+            return None
+
+        if entry.get("prompt_version") != PROMPT_VERSION or \
+                time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            return None
+
+        self._remember(key, entry)
+        return copy.deepcopy(entry.get("result"))
+
+    def set(self, key: str, result: Dict[str, Any], model_name: str = None) -> None:
+        """Store result for key; write failures are logged and otherwise ignored"""
+        path = self._entry_path(key)
+        entry = {
+            "result": result,
+            "created_at": time.time(),
+            "model": model_name,
+            "prompt_version": PROMPT_VERSION,
+        }
+        self._remember(key, copy.deepcopy(entry))
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(_json_dumps(entry))
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            temp_path.unlink(missing_ok=True)
+            logger.warning(f"Failed to write extraction cache entry: {e}")
+            return
+
+        with self._purge_lock:
+            self._writes_since_purge += 1
+            due = self._writes_since_purge >= PURGE_INTERVAL
+            if due:
+                self._writes_since_purge = 0
+        if due:
+            self.purge()
+
+    def purge(self) -> int:
+        """
+        Delete expired entries, then the oldest entries beyond max_entries
+
+        Entry age is taken from the file modification time, which is set when
+        the entry is written. Returns the number of entries removed.
+        """
+        try:
+            entries = []
+            for path in self.cache_dir.glob("*/*.json"):
+                try:
+                    entries.append((path.stat().st_mtime, path))
+                except FileNotFoundError:
+                    continue
+        except OSError as e:
+            logger.warning(f"Failed to scan extraction cache: {e}")
+            return 0
+
+        cutoff = time.time() - self.ttl_seconds
+        stale = [path for mtime, path in entries if mtime < cutoff]
+        fresh = sorted((entry for entry in entries if entry[0] >= cutoff), key=lambda entry: entry[0])
+        if self.max_entries > 0 and len(fresh) > self.max_entries:
+            stale.extend(path for _, path in fresh[:len(fresh) - self.max_entries])
+
+        removed = 0
+        for path in stale:
+            try:
+                path.unlink(missing_ok=True)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove cache entry {path.name}: {e}")
+
+        if removed:
+            logger.info(f"Purged {removed} extraction cache entries")
+        return removed
+
+
+def create_extraction_cache(cache_dir: str = None, ttl_days: int = None, memory_entries: int = None,
+                            max_entries: int = None) -> ExtractionCache:
+    """Factory function to create extraction cache from arguments or environment"""
+    return ExtractionCache(
+        cache_dir=cache_dir or os.getenv("EXTRACTION_CACHE_DIR", "data/gemini_cache"),
+        ttl_days=ttl_days if ttl_days is not None else int(os.getenv("EXTRACTION_CACHE_TTL_DAYS", "7")),
+        memory_entries=memory_entries if memory_entries is not None else int(os.getenv("EXTRACTION_CACHE_MEMORY_ENTRIES", "256")),
+        max_entries=max_entries if max_entries is not None else int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000")),
+    )
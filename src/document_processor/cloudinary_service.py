@@ -3,6 +3,7 @@ Cloudinary Image Service
 Downloads and processes images from Cloudinary URLs
 """
 
+import io
 import os
 import tempfile
 import logging
@@ -12,12 +13,21 @@ import aiohttp
 import asyncio
 from PIL import Image
 import hashlib
+import ssl
 import time
-import base64
-import hmac
 
 logger = logging.getLogger(__name__)
 
+def _create_permissive_ssl_context() -> ssl.SSLContext:
+    """SSL context without certificate verification (permissive for demo purposes)"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+# Built once at import; create_default_context loads the system CA bundle each time
+_PERMISSIVE_SSL_CONTEXT = _create_permissive_ssl_context()
+
 class CloudinaryService:
     """Service for handling Cloudinary image operations"""
     
@@ -63,16 +73,10 @@ class CloudinaryService:
             # Create session with timeout and SSL settings
             timeout = aiohttp.ClientTimeout(total=self.timeout)
             
-            # Create SSL context that's more permissive for demo purposes
-            import ssl
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
+            connector = aiohttp.TCPConnector(ssl=_PERMISSIVE_SSL_CONTEXT)
             
             async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-                logger.info(f"Downloading image from: {cloudinary_url}")
+                logger.debug("Downloading image from: %s", cloudinary_url)
                 
                 # Try regular URL first
                 response = await session.get(cloudinary_url)
@@ -89,7 +93,7 @@ class CloudinaryService:
                     
                     # Generate authenticated URL
                     auth_url = self._generate_authenticated_url(public_id)
-                    logger.info(f"Trying authenticated URL: {auth_url}")
+                    logger.debug("Trying authenticated URL: %s", auth_url)
                     
                     response = await session.get(auth_url)
                     if response.status != 200:
@@ -111,6 +115,9 @@ class CloudinaryService:
                     if not image_data:
                         raise Exception("Empty image data received")
                     
+                    # Validate the downloaded bytes before anything is written to disk
+                    await self._validate_image(image_data)
+                    
                     # Determine file extension from URL or content type
                     file_extension = self._get_file_extension(cloudinary_url, content_type)
                     
@@ -126,10 +133,7 @@ class CloudinaryService:
                     temp_file.flush()
                     temp_file.close()
                     
-                    # Validate image using PIL
-                    await self._validate_image(temp_file.name)
-                    
-                    logger.info(f"Image downloaded successfully: {temp_file.name}")
+                    logger.debug("Image downloaded successfully: %s", temp_file.name)
                     return temp_file.name
                 
                 finally:
@@ -141,43 +145,37 @@ class CloudinaryService:
             logger.error(f"Failed to download image from {cloudinary_url}: {e}")
             raise Exception(f"Image download failed: {str(e)}")
     
-    async def _validate_image(self, file_path: str):
-        """Validate downloaded image file"""
+    async def _validate_image(self, image_data: bytes):
+        """Validate downloaded image data"""
         try:
             # Run image validation in thread pool to avoid blocking
-            await asyncio.get_event_loop().run_in_executor(
-                None, self._validate_image_sync, file_path
-            )
+            await asyncio.to_thread(self._validate_image_sync, image_data)
         except Exception as e:
-            # Clean up invalid file
-            Path(file_path).unlink(missing_ok=True)
             raise Exception(f"Invalid image file: {str(e)}")
     
-    def _validate_image_sync(self, file_path: str):
-        """Synchronous image validation using PIL"""
+    def _validate_image_sync(self, image_data: bytes):
+        """Synchronous image validation using PIL, on the in-memory download"""
         try:
-            with Image.open(file_path) as img:
-                # Verify the image
+            # Check file size first (max 50MB); it needs no decoding
+            file_size = len(image_data)
+            max_size = 50 * 1024 * 1024  # 50MB
+            
+            if file_size > max_size:
+                raise Exception(f"Image too large: {file_size / (1024*1024):.1f}MB (max 50MB)")
+            
+            # One open serves both checks: size comes from the header, verify() scans the rest
+            with Image.open(io.BytesIO(image_data)) as img:
+                width, height = img.size
                 img.verify()
-                
-                # Check file size (max 50MB)
-                file_size = Path(file_path).stat().st_size
-                max_size = 50 * 1024 * 1024  # 50MB
-                
-                if file_size > max_size:
-                    raise Exception(f"Image too large: {file_size / (1024*1024):.1f}MB (max 50MB)")
-                
-                # Check image dimensions (reasonable limits)
-                img_check = Image.open(file_path)
-                width, height = img_check.size
-                
-                if width > 10000 or height > 10000:
-                    raise Exception(f"Image dimensions too large: {width}x{height}")
-                
-                if width < 100 or height < 100:
-                    logger.warning(f"Image dimensions quite small: {width}x{height}")
-                
-                logger.info(f"Image validation passed: {width}x{height}, {file_size / 1024:.1f}KB")
+            
+            # Check image dimensions (reasonable limits)
+            if width > 10000 or height > 10000:
+                raise Exception(f"Image dimensions too large: {width}x{height}")
+            
+            if width < 100 or height < 100:
+                logger.warning(f"Image dimensions quite small: {width}x{height}")
+            
+            logger.debug("Image validation passed: %dx%d, %.1fKB", width, height, file_size / 1024)
                 
         except Exception as e:
             raise Exception(f"Image validation failed: {str(e)}")
@@ -226,13 +224,7 @@ class CloudinaryService:
         try:
             timeout = aiohttp.ClientTimeout(total=10)
             
-            # Create SSL context that's more permissive
-            import ssl
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
+            connector = aiohttp.TCPConnector(ssl=_PERMISSIVE_SSL_CONTEXT)
             
             async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
                 # Use HEAD request to get headers only
@@ -33,6 +33,13 @@ class Settings(BaseSettings):
     max_file_size: int = Field(10 * 1024 * 1024, env="MAX_FILE_SIZE", description="Max file size in bytes (10MB)")
     supported_formats: list[str] = Field(["image/jpeg", "image/png", "image/bmp", "image/tiff"], description="Supported image formats")
     processing_timeout: int = Field(60, env="PROCESSING_TIMEOUT", description="Processing timeout in seconds")
+    max_concurrent_requests: int = Field(4, env="MAX_CONCURRENT_REQUESTS", description="Maximum concurrent Gemini requests for batch processing")
+    gemini_rpm: int = Field(0, env="GEMINI_RPM", description="Gemini requests per minute budget (0 disables pacing)")
+    gemini_json_mode: bool = Field(True, env="GEMINI_JSON_MODE", description="Request JSON-mode output from Gemini for extraction")
+    enable_extraction_cache: bool = Field(True, env="ENABLE_EXTRACTION_CACHE", description="Cache extraction results keyed by document content")
+    extraction_cache_dir: str = Field("data/gemini_cache", env="EXTRACTION_CACHE_DIR", description="Directory for cached extraction results")
+    extraction_cache_ttl_days: int = Field(7, env="EXTRACTION_CACHE_TTL_DAYS", description="Days before a cached extraction expires")
+    extraction_cache_memory_entries: int = Field(256, env="EXTRACTION_CACHE_MEMORY_ENTRIES", description="Cached extractions also kept in memory (0 disables)")
     
     # Validation Configuration
     min_confidence_threshold: float = Field(0.5, env="MIN_CONFIDENCE_THRESHOLD", description="Minimum confidence for valid extraction")
@@ -42,6 +49,8 @@ class Settings(BaseSettings):
     max_retries: int = Field(3, env="MAX_RETRIES", description="Maximum retry attempts for quota exceeded")
     retry_delay: int = Field(60, env="RETRY_DELAY", description="Base delay in seconds between retries")
     enable_fallback_ocr: bool = Field(True, env="ENABLE_FALLBACK_OCR", description="Enable Tesseract fallback when quota exceeded")
+    fallback_keep_raw_text: bool = Field(False, env="FALLBACK_KEEP_RAW_TEXT", description="Attach OCR text preview to fallback results")
+    tesseract_tessdata_dir: Optional[str] = Field(None, env="TESSERACT_TESSDATA_DIR", description="Traineddata directory for fallback OCR (e.g. tessdata_fast)")
     
     # Logging Configuration
     log_level: str = Field("INFO", env="LOG_LEVEL", description="Logging level")
@@ -3,26 +3,51 @@ Core Processor Module
 Gemini-based document processing with direct image-to-JSON extraction
 """
 
+import io
 import os
+import re
 import json
 import logging
 import time
 import asyncio
+import threading
 from pathlib import Path
-from typing import Dict, Any,  Optional, List
+from typing import Callable, Dict, Any,  Optional, List, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 from dataclasses import dataclass
 from datetime import datetime
+from functools import cached_property, lru_cache
 
 try:
-    import google.generativeai as genai
     from PIL import Image
 except ImportError as e:
     raise ImportError(f"Required packages missing. Install with: pip install google-generativeai pillow") from e
 
+# google.generativeai pulls in gRPC, protobuf and IPython (about a second to import),
+# so it is loaded when the first DocumentProcessor is created, not on module import
+genai = None
+
+def _load_genai():
+    """Import google.generativeai on first use"""
+    global genai
+    if genai is None:
+        try:
+            import google.generativeai as genai_module
+        except ImportError as e:
+            raise ImportError(f"Required packages missing. Install with: pip install google-generativeai pillow") from e
+        genai = genai_module
+    return genai
+
+# orjson parses Gemini responses several times faster; stdlib json is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # Try to import fallback OCR
 try:
     from .fallback_ocr import create_fallback_ocr
@@ -30,9 +55,145 @@ try:
 except ImportError:
     FALLBACK_AVAILABLE = False
 
+from .cache import create_extraction_cache
+from .schemas import DOCUMENT_SCHEMAS
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+_SUPPORTED_DOCUMENT_TYPES = frozenset({
+    'aadhaar_card', 'marksheet_10th', 'marksheet_12th',
+    'transfer_certificate', 'migration_certificate', 'entrance_scorecard',
+    'admit_card', 'caste_certificate', 'domicile_certificate', 'passport_photo'
+})
+
+_DETECTION_PROMPT = """
+        Analyze this {source} and identify its type.
+        
+        Choose from these options:
+        - aadhaar_card
+        - marksheet_10th
+        - marksheet_12th
+        - transfer_certificate
+        - migration_certificate
+        - entrance_scorecard
+        - admit_card
+        - caste_certificate
+        - domicile_certificate
+        - passport_photo
+        - other
+        
+        Return only the document type, nothing else.
+        """
+
+_IMAGE_DETECTION_PROMPT = _DETECTION_PROMPT.format(source="document image")
+_PDF_DETECTION_PROMPT = _DETECTION_PROMPT.format(source="PDF document")
+
+_BATCH_DETECTION_PROMPT = """
+        Analyze each of the following {count} document images and identify its type.
+        
+        Choose from these options:
+        - aadhaar_card
+        - marksheet_10th
+        - marksheet_12th
+        - transfer_certificate
+        - migration_certificate
+        - entrance_scorecard
+        - admit_card
+        - caste_certificate
+        - domicile_certificate
+        - passport_photo
+        - other
+        
+        Return only a JSON array of {count} document types, one per image in the order given.
+        """
+
+# Images auto-detected per Gemini call when a batch shares one detection request
+_DETECTION_BATCH_SIZE = 8
+
+# Stands in for the document type in cache keys of memoized type detections
+_DETECTION_CACHE_TYPE = "__detected_type__"
+
+# Image formats Gemini accepts inline as-is
+_GEMINI_IMAGE_MIME_TYPES = frozenset({'image/png', 'image/jpeg', 'image/webp', 'image/heic', 'image/heif'})
+
+# Server-suggested wait in quota errors, e.g. "Please retry in 27.5s"
+_RETRY_DELAY_RE = re.compile(r'retry in (\d+(?:\.\d+)?)s')
+
+# Model option list -> first option that initialized successfully in this process
+_RESOLVED_MODELS: Dict[Tuple[Optional[str], ...], str] = {}
+
+# Validation rule check: (field, value) -> issue message, or None if the value passes
+_RuleCheck = Callable[[str, Any], Optional[str]]
+# Compiled validation for one document type: required fields with their
+# missing-field messages, then (field, check) pairs for the validation rules
+_CompiledRules = Tuple[Tuple[Tuple[str, str], ...], Tuple[Tuple[str, _RuleCheck], ...]]
+
+@lru_cache(maxsize=1)
+def _schema_artifacts() -> Tuple[Dict[str, str], Dict[str, _CompiledRules]]:
+    """
+    Build the per-type extraction prompts and compiled validation rules
+    
+    Cached, so processors created after the first one reuse its build.
+    """
+    prompt_templates = {
+        doc_type: DocumentProcessor._build_extraction_prompt(doc_type, schema)
+        for doc_type, schema in DOCUMENT_SCHEMAS.items()
+    }
+    validation_rules = {
+        doc_type: DocumentProcessor._compile_validation_rules(schema)
+        for doc_type, schema in DOCUMENT_SCHEMAS.items()
+    }
+    return prompt_templates, validation_rules
+
+def _response_text(response) -> str:
+    """Read a Gemini response's text once; blocked or empty responses give ''"""
+    if not response:
+        return ""
+    try:
+        # .text re-assembles the candidate parts on every access
+        return response.text or ""
+    except ValueError:
+        return ""
+
+def _locate_json(text: str) -> str:
+    """Return the outermost {...} span of a response, or the stripped text if there is none"""
+    start = text.find('{')
+    if start != -1:
+        # Only scan back as far as the opening brace
+        end = text.rfind('}', start)
+        if end != -1:
+            return text[start:end + 1]
+    return text.strip()
+
+class _RequestRateLimiter:
+    """
+    Thread-safe token bucket pacing Gemini requests to a requests-per-minute budget
+    
+    The bucket holds at most `burst` tokens, so neither a cold start nor an
+    idle spell lets a whole minute's budget go out at once.
+    """
+    
+    def __init__(self, requests_per_minute: int, burst: int = 1):
+        self.capacity = float(max(1, min(burst, requests_per_minute)))
+        self.tokens = self.capacity
+        self.refill_rate = requests_per_minute / 60.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a request token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+@dataclass(slots=True)
 class ProcessingResult:
     """Result from document processing"""
     success: bool
@@ -60,19 +221,42 @@ class DocumentProcessor:
         self.max_retries = int(os.getenv("MAX_RETRIES", "3"))
         self.retry_delay = int(os.getenv("RETRY_DELAY", "60"))
         self.enable_fallback = os.getenv("ENABLE_FALLBACK_OCR", "true").lower() == "true"
+        self.max_concurrent_requests = int(os.getenv("MAX_CONCURRENT_REQUESTS", "4"))
+        
+        # Content-addressable cache so identical documents skip the Gemini round trip.
+        # Opt-in: entries are extracted personal data stored as plain JSON on disk.
+        self.extraction_cache = None
+        if os.getenv("ENABLE_EXTRACTION_CACHE", "false").lower() == "true":
+            self.extraction_cache = create_extraction_cache()
+        
+        # Pace requests below the quota instead of bursting into 429 retries (0 = unlimited)
+        requests_per_minute = int(os.getenv("GEMINI_RPM", "0"))
+        self._rate_limiter = None
+        if requests_per_minute > 0:
+            self._rate_limiter = _RequestRateLimiter(
+                requests_per_minute, burst=int(os.getenv("GEMINI_RPM_BURST", "1"))
+            )
+        
+        # JSON mode makes Gemini emit bare JSON (no fences or prose around it),
+        # which shortens responses and lets the parser skip recovery work
+        self._extraction_config = None
+        if os.getenv("GEMINI_JSON_MODE", "true").lower() == "true":
+            self._extraction_config = {"response_mime_type": "application/json"}
+        
+        # Extraction prompts and validation rule checks only depend on the
+        # schemas, so they are built once per process and shared by every processor
+        self._prompt_templates, self._validation_rules = _schema_artifacts()
+        
+        # Per-thread state so concurrent documents don't share the fallback image
+        self._local = threading.local()
+        self._fallback_ocr_lock = threading.Lock()
         
         # Configure Gemini
+        _load_genai()
         genai.configure(api_key=self.api_key)
         
-        # Initialize model with priority order (using full model paths)
-        model_options = [
-            model_name,
-            os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash"),  # Use env variable
-            'models/gemini-2.5-flash',  # Latest stable model
-            'models/gemini-2.0-flash',
-            'models/gemini-1.5-pro',
-            'gemini-pro'
-        ] if model_name else [
+        # An explicit model is used as-is; otherwise probe in priority order (using full model paths)
+        model_options = [model_name] if model_name else [
             os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash"),  # Use env variable first
             'models/gemini-2.5-flash',  # Latest stable model
             'models/gemini-2.0-flash',
@@ -83,12 +267,20 @@ class DocumentProcessor:
         self.model = None
         self.model_name = None
         
+        # Start from the model that already initialized in this process, so
+        # later instances skip options known to fail
+        options_key = tuple(model_options)
+        resolved_model = _RESOLVED_MODELS.get(options_key)
+        if resolved_model:
+            model_options = [resolved_model] + model_options
+        
         for model_option in model_options:
             if not model_option:
                 continue
             try:
                 self.model = genai.GenerativeModel(model_option)
                 self.model_name = model_option
+                _RESOLVED_MODELS[options_key] = model_option
                 logger.info(f"Initialized Gemini model: {model_option}")
                 break
             except Exception as e:
@@ -96,44 +288,182 @@ class DocumentProcessor:
         
         if not self.model:
             raise ValueError("Failed to initialize any Gemini model")
+    
+    @cached_property
+    def fallback_ocr(self):
+        """Fallback OCR processor, created on first use so startup skips the tesseract probe"""
+        # cached_property is not locked on Python 3.12+ and only stores the value
+        # after this returns; store it under the lock so concurrent worker threads
+        # never each build their own instance (and Tesseract pool)
+        with self._fallback_ocr_lock:
+            if 'fallback_ocr' not in self.__dict__:
+                self.__dict__['fallback_ocr'] = self._create_fallback_ocr()
+            return self.__dict__['fallback_ocr']
+    
+    def _create_fallback_ocr(self):
+        """Create the fallback OCR processor, or None when it cannot be used"""
+        if not self.enable_fallback:
+            return None
         
-        # Initialize fallback OCR if available
-        self.fallback_ocr = None
-        if FALLBACK_AVAILABLE:
-            try:
-                self.fallback_ocr = create_fallback_ocr()
-                if self.fallback_ocr.available:
-                    logger.info("Fallback OCR initialized successfully")
-                else:
-                    logger.warning("Fallback OCR dependencies not available")
-            except Exception as e:
-                logger.warning(f"Failed to initialize fallback OCR: {e}")
-        else:
+        if not FALLBACK_AVAILABLE:
             logger.warning("Fallback OCR module not available")
+            return None
+        
+        try:
+            fallback_ocr = create_fallback_ocr()
+            if fallback_ocr.available:
+                logger.info("Fallback OCR initialized successfully")
+            else:
+                logger.warning("Fallback OCR dependencies not available")
+            return fallback_ocr
+        except Exception as e:
+            logger.warning(f"Failed to initialize fallback OCR: {e}")
+            return None
     
-    async def process_document_async(self, image_path: str, document_type: str = None) -> ProcessingResult:
-        """Async version of document processing"""
-        return self.process_document(image_path, document_type)
+    async def process_document_async(
+        self,
+        image_path: str,
+        document_type: str = None,
+        file_bytes: Optional[bytes] = None
+    ) -> ProcessingResult:
+        """Async version of document processing (runs in a worker thread)"""
+        return await asyncio.to_thread(self.process_document, image_path, document_type, file_bytes)
     
-    def process_document(self, image_path: str, document_type: str = None) -> ProcessingResult:
+    async def process_documents_async(
+        self,
+        documents: List[Tuple[str, Optional[str]]],
+        max_in_flight: Optional[int] = None,
+        return_exceptions: bool = False
+    ) -> List[ProcessingResult]:
+        """
+        Process several documents concurrently
+        
+        Untyped images are read once and their types detected in shared Gemini
+        calls of up to _DETECTION_BATCH_SIZE images. Each batch's documents start
+        extracting as soon as that batch is detected, reusing the bytes already read.
+        
+        Args:
+            documents: (image_path, document_type) pairs; document_type may be None
+            max_in_flight: Maximum concurrent Gemini requests (defaults to MAX_CONCURRENT_REQUESTS)
+            return_exceptions: Return a document's exception in its place instead of
+                raising it, so one failure does not discard the rest of the batch
+            
+        Returns:
+            ProcessingResults in the same order as the input
+        """
+        semaphore = asyncio.Semaphore(max_in_flight or self.max_concurrent_requests)
+        
+        pending = [
+            index for index, (path, doc_type) in enumerate(documents)
+            if not doc_type and Path(path).suffix.lower() != '.pdf'
+        ]
+        
+        async def read_document(image_path: str) -> Optional[bytes]:
+            try:
+                return await asyncio.to_thread(Path(image_path).read_bytes)
+            except OSError:
+                # process_document reports the error for this document
+                return None
+        
+        async def detect_batch(indexes: List[int]) -> Dict[int, Tuple[Optional[str], Optional[bytes]]]:
+            contents = await asyncio.gather(*(read_document(documents[index][0]) for index in indexes))
+            readable = [(index, content) for index, content in zip(indexes, contents) if content is not None]
+            detected = []
+            if readable:
+                async with semaphore:
+                    detected = await asyncio.to_thread(
+                        self.detect_document_types, [content for _, content in readable]
+                    )
+            return {
+                index: (doc_type, content)
+                for (index, content), doc_type in zip(readable, detected)
+            }
+        
+        batch_of: Dict[int, asyncio.Task] = {}
+        if len(pending) > 1:
+            for start in range(0, len(pending), _DETECTION_BATCH_SIZE):
+                indexes = pending[start:start + _DETECTION_BATCH_SIZE]
+                task = asyncio.ensure_future(detect_batch(indexes))
+                batch_of.update((index, task) for index in indexes)
+        
+        async def process_one(index: int) -> ProcessingResult:
+            image_path, document_type = documents[index]
+            file_bytes = None
+            if index in batch_of:
+                document_type, file_bytes = (await batch_of[index]).get(index, (None, None))
+            async with semaphore:
+                return await self.process_document_async(image_path, document_type, file_bytes)
+        
+        return await asyncio.gather(
+            *(process_one(index) for index in range(len(documents))),
+            return_exceptions=return_exceptions
+        )
+    
+    async def process_document_multi_type(
+        self,
+        image_path: str,
+        document_types: List[str]
+    ) -> Dict[str, ProcessingResult]:
+        """
+        Extract one document as several candidate types concurrently
+        
+        Useful when the document type is uncertain: all candidates cost one
+        round trip instead of one per type.
+        
+        Args:
+            image_path: Path to document image
+            document_types: Candidate document types
+            
+        Returns:
+            Mapping of document type to its ProcessingResult
+        """
+        results = await self.process_documents_async(
+            [(image_path, doc_type) for doc_type in document_types]
+        )
+        return dict(zip(document_types, results))
+    
+    def process_document(
+        self,
+        image_path: str,
+        document_type: str = None,
+        file_bytes: Optional[bytes] = None
+    ) -> ProcessingResult:
         """
         Process document image with Gemini
         
         Args:
             image_path: Path to document image
             document_type: Optional hint about document type
+            file_bytes: Contents of image_path if the caller has already read it
             
         Returns:
             ProcessingResult with extracted data and validation
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
+        self._local.current_image = None
         
         try:
             # Determine file type and prepare for processing
             file_path = Path(image_path)
             file_extension = file_path.suffix.lower()
             
-            if file_extension == '.pdf':
+            # Read the file once; the cache key, image decode and inline blob share it
+            if file_bytes is None and (self.extraction_cache or file_extension != '.pdf'):
+                file_bytes = file_path.read_bytes()
+            
+            cache_key = None
+            cached = None
+            if self.extraction_cache:
+                cache_key = self.extraction_cache.make_key(
+                    self.model_name, document_type, file_bytes
+                )
+                cached = self.extraction_cache.get(cache_key)
+            
+            if cached:
+                document_type = cached['document_type']
+                extracted_data = cached['extracted_data']
+                metadata = dict(cached['metadata'], cache_hit=True)
+            elif file_extension == '.pdf':
                 # For PDF files, upload directly to Gemini
                 document_data = self._prepare_pdf_for_gemini(image_path)
                 
@@ -146,39 +476,53 @@ class DocumentProcessor:
                 
                 metadata = {
                     'file_type': 'pdf',
+                    'model_used': self.model_name,
                     'file_size': file_path.stat().st_size,
                     'fields_extracted': len(extracted_data)
                 }
             else:
                 # For image files, use existing logic
-                image = Image.open(image_path)
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
+                # Image.open only reads the header; pixels are decoded lazily if
+                # the fallback or a PNG re-encode actually needs them
+                image = Image.open(io.BytesIO(file_bytes))
+                mime_type = Image.MIME.get(image.format)
                 
                 # Store image for potential fallback use
-                self._current_image = image
+                self._local.current_image = image
+                
+                # Encode once; detection, extraction and retries all reuse the same blob
+                image_part = self._encode_image_part(image, file_bytes, mime_type)
                 
                 # Auto-detect document type if not provided
                 if not document_type:
-                    document_type = self._detect_document_type(image)
+                    document_type = self._detect_document_type_cached(image_part, file_bytes)
                 
                 # Extract data using Gemini
-                extracted_data = self._extract_with_gemini(image, document_type)
+                extracted_data = self._extract_with_gemini(image_part, document_type)
                 
                 metadata = {
                     'file_type': 'image',
+                    'model_used': self.model_name,
                     'image_size': image.size,
                     'image_mode': image.mode,
                     'fields_extracted': len(extracted_data)
                 }
             
+            # Only cache genuine Gemini results, never fallback or quota placeholders
+            if cache_key and not cached and extracted_data and '_extraction_status' not in extracted_data:
+                self.extraction_cache.set(cache_key, {
+                    'document_type': document_type,
+                    'extracted_data': extracted_data,
+                    'metadata': metadata
+                }, model_name=self.model_name)
+            
             # Validate extracted data
             validation_issues = self._validate_data(extracted_data, document_type)
             
             # Calculate confidence
             confidence = self._calculate_confidence(extracted_data, validation_issues)
             
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             
             return ProcessingResult(
                 success=True,
@@ -196,47 +540,106 @@ class DocumentProcessor:
                 success=False,
                 document_type=document_type or "unknown",
                 extracted_data={},
-                processing_time=time.time() - start_time,
+                processing_time=time.perf_counter() - start_time,
                 validation_issues=[],
                 confidence_score=0.0,
                 error_message=str(e)
             )
     
-    def _detect_document_type(self, image: Image.Image) -> str:
-        """Auto-detect document type using Gemini with retry logic"""
-        detection_prompt = """
-        Analyze this document image and identify its type.
+    def detect_document_types(self, contents: List[bytes]) -> List[Optional[str]]:
+        """
+        Detect the types of several document images with one Gemini call per batch
         
-        Choose from these options:
-        - aadhaar_card
-        - marksheet_10th
-        - marksheet_12th
-        - transfer_certificate
-        - migration_certificate
-        - entrance_scorecard
-        - admit_card
-        - caste_certificate
-        - domicile_certificate
-        - passport_photo
-        - other
+        Detections are memoized like single-document ones, so a later
+        process_document on the same bytes does not detect the type again.
         
-        Return only the document type, nothing else.
+        Args:
+            contents: Raw bytes of document images
+            
+        Returns:
+            Document types in input order; None where batch detection failed, so
+            the caller can fall back to detecting that document on its own
+        """
+        document_types: List[Optional[str]] = [None] * len(contents)
+        keys: List[Optional[str]] = [None] * len(contents)
+        
+        undetected = []
+        for index, file_bytes in enumerate(contents):
+            if self.extraction_cache:
+                keys[index] = self._detection_cache_key(file_bytes)
+                cached = self.extraction_cache.get(keys[index])
+                if cached:
+                    document_types[index] = cached['document_type']
+                    continue
+            undetected.append(index)
+        
+        for start in range(0, len(undetected), _DETECTION_BATCH_SIZE):
+            batch = undetected[start:start + _DETECTION_BATCH_SIZE]
+            try:
+                image_parts = []
+                for index in batch:
+                    with Image.open(io.BytesIO(contents[index])) as image:
+                        image_parts.append(
+                            self._encode_image_part(image, contents[index], Image.MIME.get(image.format))
+                        )
+                
+                prompt = _BATCH_DETECTION_PROMPT.format(count=len(batch))
+                response_text = _response_text(self._generate_content([prompt, *image_parts]))
+                detected = _json_loads(response_text[response_text.find('['):response_text.rfind(']') + 1])
+                if not isinstance(detected, list) or len(detected) != len(batch):
+                    raise ValueError(f"expected {len(batch)} document types, got {response_text[:100]!r}")
+            except Exception as e:
+                logger.warning(f"Batch document type detection failed, detecting individually: {e}")
+                continue
+            
+            for index, doc_type in zip(batch, detected):
+                doc_type = str(doc_type).strip().lower()
+                if doc_type not in _SUPPORTED_DOCUMENT_TYPES:
+                    doc_type = 'other'
+                document_types[index] = doc_type
+                # 'other' is also what failed detections return, so it is never memoized
+                if keys[index] and doc_type != 'other':
+                    self.extraction_cache.set(keys[index], {'document_type': doc_type}, model_name=self.model_name)
+        
+        return document_types
+    
+    def _detection_cache_key(self, file_bytes: bytes) -> str:
+        """Cache key under which the detected type of a file is memoized"""
+        return self.extraction_cache.make_key(self.model_name, _DETECTION_CACHE_TYPE, file_bytes)
+    
+    def _detect_document_type_cached(self, image: Any, file_bytes: bytes) -> str:
         """
+        Detect document type, reusing an earlier detection of the same file
         
+        Detections are memoized even when extraction fails, so a resubmitted
+        document only pays for the extraction it is retrying.
+        """
+        if not self.extraction_cache:
+            return self._detect_document_type(image)
+        
+        key = self._detection_cache_key(file_bytes)
+        cached = self.extraction_cache.get(key)
+        if cached:
+            return cached['document_type']
+        
+        document_type = self._detect_document_type(image)
+        # 'other' is also what failed detections return, so it is never memoized
+        if document_type != 'other':
+            self.extraction_cache.set(key, {'document_type': document_type}, model_name=self.model_name)
+        return document_type
+    
+    def _detect_document_type(self, image: Any) -> str:
+        """Auto-detect document type using Gemini with retry logic"""
         max_retries = 2
         base_delay = 1
         
         for attempt in range(max_retries):
             try:
-                response = self.model.generate_content([detection_prompt, image])
-                if response and response.text:
-                    doc_type = response.text.strip().lower()
-                    supported_types = {
-                        'aadhaar_card', 'marksheet_10th', 'marksheet_12th', 
-                        'transfer_certificate', 'migration_certificate', 'entrance_scorecard',
-                        'admit_card', 'caste_certificate', 'domicile_certificate', 'passport_photo'
-                    }
-                    return doc_type if doc_type in supported_types else 'other'
+                response = self._generate_content([_IMAGE_DETECTION_PROMPT, image])
+                response_text = _response_text(response)
+                if response_text:
+                    doc_type = response_text.strip().lower()
+                    return doc_type if doc_type in _SUPPORTED_DOCUMENT_TYPES else 'other'
             except Exception as e:
                 error_str = str(e)
                 if "429" in error_str or "quota" in error_str.lower():
@@ -254,7 +657,7 @@ class DocumentProcessor:
         
         return 'other'
     
-    def _extract_with_gemini(self, image: Image.Image, document_type: str) -> Dict[str, Any]:
+    def _extract_with_gemini(self, image: Any, document_type: str) -> Dict[str, Any]:
         """Extract structured data using Gemini with retry logic"""
         schema = self._get_document_schema(document_type)
         prompt = self._create_extraction_prompt(document_type, schema)
@@ -262,14 +665,27 @@ class DocumentProcessor:
         max_retries = 3
         base_delay = 2
         
+        request_prompt = prompt
         for attempt in range(max_retries):
             try:
-                response = self.model.generate_content([prompt, image])
-                if response and response.text:
-                    return self._parse_json_response(response.text)
+                response = self._generate_content(
+                    [request_prompt, image], generation_config=self._extraction_config
+                )
+                response_text = _response_text(response)
+                if response_text:
+                    return self._parse_json_response(response_text)
                 else:
                     logger.warning(f"Empty response from Gemini on attempt {attempt + 1}")
                     
+            except ValueError as e:
+                # Malformed output: retry quickly, telling the model what was wrong
+                if attempt < max_retries - 1:
+                    logger.warning(f"Invalid JSON from Gemini, retrying with feedback (attempt {attempt + 1}/{max_retries})")
+                    request_prompt = self._add_json_feedback(prompt, e)
+                    time.sleep(attempt + 1)
+                    continue
+                return self._create_fallback_data(document_type)
+                    
             except Exception as e:
                 error_str = str(e)
                 
@@ -278,15 +694,10 @@ class DocumentProcessor:
                     if attempt < max_retries - 1:
                         # Extract retry delay from error message if available
                         retry_delay = base_delay * (2 ** attempt)  # Exponential backoff
-                        if "retry in" in error_str:
-                            try:
-                                # Try to extract the exact retry time from error message
-                                import re
-                                match = re.search(r'retry in (\d+(?:\.\d+)?)s', error_str)
-                                if match:
-                                    retry_delay = float(match.group(1))
-                            except:
-                                pass
+                        # Use the exact retry time from the error message if available
+                        match = _RETRY_DELAY_RE.search(error_str)
+                        if match:
+                            retry_delay = float(match.group(1))
                         
                         logger.warning(f"Quota exceeded, retrying in {retry_delay:.1f} seconds (attempt {attempt + 1}/{max_retries})")
                         time.sleep(retry_delay)
@@ -308,13 +719,43 @@ class DocumentProcessor:
         
         return {}
     
+    @staticmethod
+    def _encode_image_part(image: Image.Image, file_bytes: bytes, mime_type: Optional[str]) -> Dict[str, Any]:
+        """
+        Build the inline image blob sent to Gemini
+        
+        Formats Gemini accepts are sent as the original file bytes; anything else
+        is encoded to PNG once, instead of the SDK re-encoding the image per call.
+        """
+        if mime_type in _GEMINI_IMAGE_MIME_TYPES:
+            return {'mime_type': mime_type, 'data': file_bytes}
+        
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return {'mime_type': 'image/png', 'data': buffer.getvalue()}
+    
+    def _generate_content(self, contents: List[Any], **kwargs):
+        """Call Gemini, waiting for the rate limiter first when one is configured"""
+        if self._rate_limiter:
+            self._rate_limiter.acquire()
+        return self.model.generate_content(contents, **kwargs)
+    
     def _get_document_schema(self, document_type: str) -> Dict[str, Any]:
         """Get schema for document type"""
-        from .schemas import DOCUMENT_SCHEMAS
         return DOCUMENT_SCHEMAS.get(document_type, DOCUMENT_SCHEMAS['default'])
     
     def _create_extraction_prompt(self, document_type: str, schema: Dict[str, Any]) -> str:
-        """Create extraction prompt for document type"""
+        """Create extraction prompt for document type, reusing the prebuilt one when available"""
+        prompt = self._prompt_templates.get(document_type)
+        if prompt is None:
+            prompt = self._build_extraction_prompt(document_type, schema)
+        return prompt
+    
+    @staticmethod
+    def _build_extraction_prompt(document_type: str, schema: Dict[str, Any]) -> str:
+        """Build extraction prompt text from document type and schema"""
         required_fields = schema.get('required_fields', [])
         optional_fields = schema.get('optional_fields', [])
         
@@ -345,52 +786,83 @@ Extract the data now:"""
         return prompt
     
     def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse Gemini JSON response"""
+        """Parse Gemini JSON response, raising ValueError unless it is a JSON object"""
         try:
-            # Find JSON in response
-            start = response_text.find('{')
-            end = response_text.rfind('}')
-            
-            if start != -1 and end != -1:
-                json_str = response_text[start:end+1]
-                return json.loads(json_str)
-            else:
-                return json.loads(response_text.strip())
-                
+            data = _json_loads(_locate_json(response_text).encode())
         except json.JSONDecodeError as e:
             logger.error(f"JSON parsing failed: {e}")
-            raise Exception(f"Failed to parse JSON response: {e}")
+            raise ValueError(f"Failed to parse JSON response: {e}") from e
+        
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        return data
+    
+    @staticmethod
+    def _add_json_feedback(prompt: str, error: Exception) -> str:
+        """Append the parse error to the prompt so the retry can correct its output"""
+        return (
+            f"{prompt}\n\nYour previous output was invalid: {error}. "
+            "Fix it and return only the corrected JSON object."
+        )
     
     def _validate_data(self, data: Dict[str, Any], document_type: str) -> List[str]:
         """Validate extracted data"""
-        schema = self._get_document_schema(document_type)
         issues = []
-        
-        required_fields = schema.get('required_fields', [])
-        validation_rules = schema.get('validation_rules', {})
+        required_fields, rule_checks = self._validation_rules.get(
+            document_type, self._validation_rules['default']
+        )
         
         # Check required fields
-        for field in required_fields:
-            if field not in data or data[field] is None or data[field] == "":
-                issues.append(f"Missing required field: {field}")
+        for field, missing_message in required_fields:
+            value = data.get(field)
+            if value is None or value == "":
+                issues.append(missing_message)
         
         # Check validation rules
-        for field, rule in validation_rules.items():
-            if field in data and data[field] is not None:
-                value = data[field]
-                
-                if 'year' in rule and 'digit' in rule:
-                    if not (isinstance(value, (int, str)) and len(str(value)) == 4):
-                        issues.append(f"{field} should be 4-digit year, got: {value}")
-                
-                elif 'digits' in rule:
-                    expected_length = int(''.join(filter(str.isdigit, rule)))
-                    cleaned_value = str(value).replace(' ', '').replace('-', '')
-                    if len(cleaned_value) != expected_length:
-                        issues.append(f"{field} should be {expected_length} digits, got: {value}")
+        for field, check in rule_checks:
+            value = data.get(field)
+            if value is not None:
+                issue = check(field, value)
+                if issue:
+                    issues.append(issue)
         
         return issues
     
+    @staticmethod
+    def _compile_validation_rules(schema: Dict[str, Any]) -> _CompiledRules:
+        """
+        Precompute a schema's required-field messages and rule checks
+        
+        Rule descriptions become (field, check) pairs; each check returns an issue
+        message, or None if the value passes. Rules without a machine-checkable
+        form (e.g. 'Full course name') are skipped.
+        """
+        def check_year(field: str, value: Any) -> Optional[str]:
+            if not (isinstance(value, (int, str)) and len(str(value)) == 4):
+                return f"{field} should be 4-digit year, got: {value}"
+            return None
+        
+        def digits_check(expected_length: int) -> _RuleCheck:
+            def check_digits(field: str, value: Any) -> Optional[str]:
+                # Length without spaces and dashes, counted rather than building stripped copies
+                text = str(value)
+                if len(text) - text.count(' ') - text.count('-') != expected_length:
+                    return f"{field} should be {expected_length} digits, got: {value}"
+                return None
+            return check_digits
+        
+        checks = []
+        for field, rule in schema.get('validation_rules', {}).items():
+            if 'year' in rule and 'digit' in rule:
+                checks.append((field, check_year))
+            elif 'digits' in rule:
+                checks.append((field, digits_check(int(''.join(filter(str.isdigit, rule))))))
+        
+        required = tuple(
+            (field, f"Missing required field: {field}") for field in schema.get('required_fields', [])
+        )
+        return required, tuple(checks)
+    
     def _prepare_pdf_for_gemini(self, pdf_path: str):
         """Prepare PDF file for Gemini processing"""
         try:
@@ -403,39 +875,16 @@ Extract the data now:"""
     
     def _detect_document_type_pdf(self, pdf_data) -> str:
         """Auto-detect document type for PDF using Gemini with retry logic"""
-        detection_prompt = """
-        Analyze this PDF document and identify its type.
-        
-        Choose from these options:
-        - aadhaar_card
-        - marksheet_10th
-        - marksheet_12th
-        - transfer_certificate
-        - migration_certificate
-        - entrance_scorecard
-        - admit_card
-        - caste_certificate
-        - domicile_certificate
-        - passport_photo
-        - other
-        
-        Return only the document type, nothing else.
-        """
-        
         max_retries = 2
         base_delay = 1
         
         for attempt in range(max_retries):
             try:
-                response = self.model.generate_content([detection_prompt, pdf_data])
-                if response and response.text:
-                    doc_type = response.text.strip().lower()
-                    supported_types = {
-                        'aadhaar_card', 'marksheet_10th', 'marksheet_12th', 
-                        'transfer_certificate', 'migration_certificate', 'entrance_scorecard',
-                        'admit_card', 'caste_certificate', 'domicile_certificate', 'passport_photo'
-                    }
-                    return doc_type if doc_type in supported_types else 'other'
+                response = self._generate_content([_PDF_DETECTION_PROMPT, pdf_data])
+                response_text = _response_text(response)
+                if response_text:
+                    doc_type = response_text.strip().lower()
+                    return doc_type if doc_type in _SUPPORTED_DOCUMENT_TYPES else 'other'
             except Exception as e:
                 error_str = str(e)
                 if "429" in error_str or "quota" in error_str.lower():
@@ -461,28 +910,28 @@ Extract the data now:"""
         max_retries = 3
         base_delay = 2
         
+        request_prompt = prompt
+        response_text = ""
         for attempt in range(max_retries):
             try:
-                response = self.model.generate_content([prompt, pdf_data])
-                if response and response.text:
-                    # Clean and parse JSON response
-                    response_text = response.text.strip()
-                    if response_text.startswith('```json'):
-                        response_text = response_text[7:]  # Remove ```json
-                    if response_text.endswith('```'):
-                        response_text = response_text[:-3]  # Remove ```
-                    
-                    return json.loads(response_text.strip())
+                response = self._generate_content(
+                    [request_prompt, pdf_data], generation_config=self._extraction_config
+                )
+                response_text = _response_text(response)
+                if response_text:
+                    # Markdown fences always sit outside the braces, so bounding
+                    # the JSON object skips them without a separate strip pass
+                    return self._parse_json_response(response_text)
                 else:
                     logger.warning(f"Empty response from Gemini PDF processing on attempt {attempt + 1}")
                     
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 logger.error(f"Failed to parse Gemini JSON response for PDF: {e}")
-                logger.debug(f"Raw response: {response.text if 'response' in locals() else 'None'}")
+                logger.debug(f"Raw response: {response_text}")
                 if attempt < max_retries - 1:
-                    delay = base_delay * (2 ** attempt)
-                    logger.warning(f"Retrying JSON parsing in {delay} seconds")
-                    time.sleep(delay)
+                    logger.warning(f"Retrying PDF extraction with feedback (attempt {attempt + 1}/{max_retries})")
+                    request_prompt = self._add_json_feedback(prompt, e)
+                    time.sleep(attempt + 1)
                     continue
                 else:
                     return self._create_fallback_data(document_type)
@@ -494,14 +943,10 @@ Extract the data now:"""
                 if "429" in error_str or "quota" in error_str.lower():
                     if attempt < max_retries - 1:
                         retry_delay = base_delay * (2 ** attempt)
-                        if "retry in" in error_str:
-                            try:
-                                import re
-                                match = re.search(r'retry in (\d+(?:\.\d+)?)s', error_str)
-                                if match:
-                                    retry_delay = float(match.group(1))
-                            except:
-                                pass
+                        # Use the exact retry time from the error message if available
+                        match = _RETRY_DELAY_RE.search(error_str)
+                        if match:
+                            retry_delay = float(match.group(1))
                         
                         logger.warning(f"PDF processing quota exceeded, retrying in {retry_delay:.1f} seconds (attempt {attempt + 1}/{max_retries})")
                         time.sleep(retry_delay)
@@ -529,7 +974,7 @@ Extract the data now:"""
         base_confidence = 0.7
         
         # Bonus for extracted fields
-        field_count = len([v for v in data.values() if v is not None and v != ""])
+        field_count = sum(1 for v in data.values() if v is not None and v != "")
         if field_count >= 5:
             base_confidence += 0.2
         elif field_count >= 3:
@@ -543,10 +988,11 @@ Extract the data now:"""
     def _create_fallback_data(self, document_type: str) -> Dict[str, Any]:
         """Create fallback data when API fails"""
         # Try fallback OCR first if available
-        if self.fallback_ocr and self.fallback_ocr.available and hasattr(self, '_current_image'):
+        current_image = getattr(self._local, 'current_image', None)
+        if current_image is not None and self.fallback_ocr and self.fallback_ocr.available:
             try:
                 logger.info("Attempting fallback OCR extraction")
-                fallback_data = self.fallback_ocr.extract_text_basic(self._current_image, document_type)
+                fallback_data = self.fallback_ocr.extract_text_basic(current_image, document_type)
                 fallback_data['_extraction_status'] = 'fallback_ocr_used'
                 return fallback_data
             except Exception as e:
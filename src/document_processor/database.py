@@ -91,12 +91,10 @@ class StudentDocument(Document):
         """Get the most recently processed document, optionally filtered by type"""
         filtered_docs = self.documents
         if doc_type:
-            filtered_docs = [doc for doc in self.documents if doc.docType == doc_type]
+            # Filter lazily; max() consumes it in the same pass without building a list
+            filtered_docs = (doc for doc in self.documents if doc.docType == doc_type)
         
-        if not filtered_docs:
-            return None
-        
-        return max(filtered_docs, key=lambda doc: doc.processedAt)
+        return max(filtered_docs, key=lambda doc: doc.processedAt, default=None)
 
 class DatabaseManager:
     """Database connection and initialization manager"""
@@ -127,6 +125,12 @@ class DatabaseManager:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
+    def get_collection(self, name: str):
+        """Get a raw Motor collection backed by the shared client"""
+        if self.database is None:
+            raise RuntimeError("Database not connected")
+        return self.database[name]
+    
     async def disconnect_db(self):
         """Close database connection"""
         if self.client:
@@ -3,45 +3,183 @@ Fallback OCR Module
 Basic text extraction when Gemini API is unavailable
 """
 
-import logging
-from typing import Dict, Any, List
-from PIL import Image
 import io
-import base64
+import os
+import importlib.util
+import logging
+import queue
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Any, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Prefer Google RE2 (linear-time, no backtracking on noisy OCR text) when installed
+try:
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
 
 logger = logging.getLogger(__name__)
 
+# In-process Tesseract bindings, used instead of pytesseract when installed so the
+# language models stay loaded rather than a tesseract process starting per call
+_TESSEROCR_AVAILABLE = importlib.util.find_spec("tesserocr") is not None
+
+# Field patterns fused into one alternation per document type so the OCR
+# text is scanned once; the named group that matched identifies the field.
+# [^\S\n] is any whitespace but a newline, so no match spans two lines.
+_AADHAAR_FIELDS_RE = _re_engine.compile(
+    r'(?P<aadhaar_number>\b\d{4}[^\S\n]*\d{4}[^\S\n]*\d{4}\b)'
+    r'|(?P<date_of_birth>\b\d{1,2}[/-]\d{1,2}[/-]\d{4}\b)'
+)
+# Applied to lowercased text, so the roll number group only keeps digits
+_MARKSHEET_FIELDS_RE = _re_engine.compile(
+    r'(?P<roll_number>roll[^\S\n]*(?:no|number)?(?::|[^\S\n])*(?P<roll_value>[A-Z0-9]+))'
+    r'|(?P<year>\b20\d{2}\b)'
+)
+_NUMBER_RE = _re_engine.compile(r'\b\d{4,}\b')
+# Any letter, found by one C-level scan instead of a per-character generator
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+# Strips a leading "... Name:" label in any case, in a single pass over the line
+_NAME_LABEL_RE = _re_engine.compile(r'(?i)^.*?\bname\b[ \t]*:?[ \t]*')
+
+def _scan_fields(pattern, text: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (field, match) for the first match of each field on a line
+
+    Matches the old line-by-line scan, which searched each line once per
+    field: callers that keep the last value seen get the first match on
+    the last line that has one. Each search resumes one character past the
+    previous match's start, so a field whose match overlaps another's (a
+    roll number that is also a year) is still found.
+    """
+    field_lines = {}
+    line = 0
+    position = 0
+    match = pattern.search(text)
+    while match:
+        line += text.count('\n', position, match.start())
+        position = match.start()
+        if field_lines.get(match.lastgroup) != line:
+            field_lines[match.lastgroup] = line
+            yield match.lastgroup, match
+        match = pattern.search(text, position + 1)
+
+@lru_cache(maxsize=1)
+def _tesseract_version() -> Optional[str]:
+    """Probe the tesseract binary once per process; None if it cannot be run"""
+    try:
+        if _TESSEROCR_AVAILABLE:
+            import tesserocr
+            return tesserocr.tesseract_version()
+        import pytesseract
+        return str(pytesseract.get_tesseract_version())
+    except Exception as e:
+        logger.warning(f"Tesseract binary not usable for fallback OCR: {e}")
+        return None
+
+class _TesseractAPIPool:
+    """Long-lived tesserocr API instances, created on demand up to a fixed size"""
+    
+    def __init__(self, size: int, **api_kwargs):
+        self.size = size
+        self._api_kwargs = api_kwargs
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def api(self):
+        """Borrow an API instance, waiting for one to be returned if all are busy"""
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    import tesserocr
+                    api = tesserocr.PyTessBaseAPI(**self._api_kwargs)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._idle.get()
+        try:
+            yield api
+        finally:
+            self._idle.put(api)
+
 class FallbackOCR:
     """
     Fallback OCR processor for when Gemini API is unavailable
     Uses basic text extraction methods
     """
     
-    def __init__(self):
-        """Initialize fallback OCR"""
+    def __init__(self, keep_raw_text: bool = None, tessdata_dir: str = None):
+        """
+        Initialize fallback OCR
+        
+        Args:
+            keep_raw_text: Attach a 500-character OCR text preview to results
+                (defaults to FALLBACK_KEEP_RAW_TEXT, off unless set)
+            tessdata_dir: Directory of traineddata models to use instead of the
+                system ones, e.g. tessdata_fast (defaults to TESSERACT_TESSDATA_DIR)
+        """
         self.available = self._check_dependencies()
+        if keep_raw_text is None:
+            keep_raw_text = os.getenv("FALLBACK_KEEP_RAW_TEXT", "false").lower() == "true"
+        self.keep_raw_text = keep_raw_text
+        
+        # The integer tessdata_fast models are LSTM-only, so pin the LSTM engine
+        tessdata_dir = tessdata_dir or os.getenv("TESSERACT_TESSDATA_DIR")
+        self._tesseract_config = f'--tessdata-dir "{tessdata_dir}" --oem 1' if tessdata_dir else ''
+        
+        # One tesserocr API per CPU; built here rather than lazily so concurrent
+        # batch threads can never race into creating separate pools. The API
+        # instances themselves are still only created on first use.
+        self._api_pool = None
+        if _TESSEROCR_AVAILABLE:
+            api_kwargs = {'path': tessdata_dir, 'oem': 1} if tessdata_dir else {}  # 1 = LSTM only
+            self._api_pool = _TesseractAPIPool(os.cpu_count() or 1, **api_kwargs)
+        
+        # Document type -> field extractor; other types use generic extraction
+        self._field_extractors = {
+            'aadhaar_card': self._extract_aadhaar_fields,
+            'marksheet_10th': self._extract_marksheet_fields,
+            'marksheet_12th': self._extract_marksheet_fields,
+        }
     
     def _check_dependencies(self) -> bool:
         """Check if fallback OCR dependencies are available"""
-        try:
-            import pytesseract
-            return True
-        except ImportError:
+        # Locate the package without importing it; pytesseract (and the numpy/pandas
+        # it pulls in) is only imported when a fallback extraction actually runs
+        if not _TESSEROCR_AVAILABLE and importlib.util.find_spec("pytesseract") is None:
             logger.warning("Tesseract not available for fallback OCR")
             return False
+        return True
     
-    def extract_text_basic(self, image: Image.Image, document_type: str) -> Dict[str, Any]:
+    def extract_text_basic(self, image: 'Image.Image', document_type: str) -> Dict[str, Any]:
         """
         Extract basic text from image using available OCR methods
         """
-        if not self.available:
+        if not self.available or _tesseract_version() is None:
             return self._create_placeholder_data(document_type)
         
         try:
-            import pytesseract
-            
             # Convert image to text
-            text = pytesseract.image_to_string(image)
+            text = self._ocr_pages([image])[0]
             
             # Basic field extraction based on document type
             extracted_data = self._extract_fields_from_text(text, document_type)
@@ -52,95 +190,216 @@ class FallbackOCR:
             logger.error(f"Fallback OCR failed: {e}")
             return self._create_placeholder_data(document_type)
     
+    def extract_text_batch(self, images: List['Image.Image'], document_type: str) -> List[Dict[str, Any]]:
+        """
+        Extract basic text from several images (e.g. the pages of one document)
+        
+        Images are split into one chunk per CPU and each chunk is recognized by a
+        single tesseract process reading a list file, instead of one process per image.
+        
+        Args:
+            images: Images to process
+            document_type: Document type used for field extraction
+            
+        Returns:
+            Extracted data for each image, in input order
+        """
+        if not images:
+            return []
+        if not self.available or _tesseract_version() is None:
+            return [self._create_placeholder_data(document_type) for _ in images]
+        
+        workers = min(len(images), os.cpu_count() or 1)
+        chunk_size = -(-len(images) // workers)
+        chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+        
+        def process_chunk(chunk: List['Image.Image']) -> List[Dict[str, Any]]:
+            try:
+                pages = self._ocr_pages(chunk)
+            except Exception as e:
+                logger.warning(f"Batched Tesseract run failed, processing images individually: {e}")
+                return [self.extract_text_basic(image, document_type) for image in chunk]
+            return [self._extract_fields_from_text(text, document_type) for text in pages]
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [data for chunk_results in executor.map(process_chunk, chunks) for data in chunk_results]
+    
+    def _ocr_pages(self, images: List['Image.Image']) -> List[str]:
+        """
+        Recognize images with one tesseract process, or with pooled tesserocr APIs
+        
+        Pages are written as uncompressed PGM and passed to tesseract by path, so
+        pytesseract skips its own PNG encode (zlib dominates that cost on full pages).
+        Several pages are passed as a list file.
+        """
+        if self._api_pool:
+            pages = []
+            for image in images:
+                prepared = self._prepare_image(image)
+                with self._api_pool.api() as api:
+                    api.SetImage(prepared)
+                    pages.append(api.GetUTF8Text())
+            return pages
+        
+        import pytesseract
+        
+        with tempfile.TemporaryDirectory(prefix='fallback_ocr_') as temp_dir:
+            paths = []
+            for index, image in enumerate(images):
+                path = os.path.join(temp_dir, f'page_{index}.pgm')
+                self._prepare_image(image).save(path)
+                paths.append(path)
+            
+            if len(paths) == 1:
+                source = paths[0]
+            else:
+                source = os.path.join(temp_dir, 'pages.txt')
+                with open(source, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(paths) + '\n')
+            
+            text = pytesseract.image_to_string(source, config=self._tesseract_config)
+        
+        # Tesseract ends every page with a form feed
+        pages = text.split('\f')
+        if len(pages) < len(images):
+            raise ValueError(f"expected {len(images)} pages, got {len(pages)}")
+        return pages[:len(images)]
+    
+    @staticmethod
+    def _reopen_undecoded_jpeg(image: 'Image.Image') -> Optional['Image.Image']:
+        """Open a fresh handle on a JPEG whose pixels are not decoded yet, or None"""
+        # Decoder tiles are only pending until the pixels are loaded
+        if image.format != 'JPEG' or not getattr(image, 'tile', None):
+            return None
+        
+        from PIL import Image
+        
+        if image.filename:
+            return Image.open(image.filename)
+        fp = getattr(image, 'fp', None)
+        if isinstance(fp, io.BytesIO):
+            return Image.open(io.BytesIO(fp.getvalue()))
+        return None
+    
+    @staticmethod
+    def _prepare_image(image: 'Image.Image') -> 'Image.Image':
+        """
+        Cheap OCR preprocessing: upright, single-channel, contrast stretched
+        
+        Tesseract binarizes internally, so grayscale loses nothing, and pytesseract
+        then serializes a third of the data for each call.
+        """
+        from PIL import ImageOps
+        
+        # For a still-unloaded JPEG, have libjpeg decode straight to luminance
+        # instead of building RGB and converting it. draft() reconfigures the
+        # image in place, so it is only applied to a private re-open; the
+        # caller's image (and the mode reported in its metadata) is left alone
+        private = FallbackOCR._reopen_undecoded_jpeg(image)
+        if private is not None:
+            private.draft('L', private.size)
+            image = private
+        
+        # Phone photos are usually stored sideways with an EXIF orientation tag;
+        # honour it instead of leaving Tesseract to read rotated text
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'L':
+            image = image.convert('L')
+        
+        # Clean scans already have over 1% pure black and pure white, where the
+        # stretch maps every level to itself; skip that full pass over the page
+        histogram = image.histogram()
+        cut = image.width * image.height // 100
+        if histogram[0] > cut and histogram[255] > cut:
+            return image
+        return ImageOps.autocontrast(image, cutoff=1)
+    
     def _extract_fields_from_text(self, text: str, document_type: str) -> Dict[str, Any]:
         """
         Extract fields from raw text using pattern matching
         """
         data = {}
-        text_lines = [line.strip() for line in text.split('\n') if line.strip()]
+        text_lines = []
+        lower_lines = []
+        # Case-fold the whole document once and keep it line-aligned with the original
+        text_lower = text.lower()
+        for line, line_lower in zip(text.split('\n'), text_lower.split('\n')):
+            line = line.strip()
+            if line:
+                text_lines.append(line)
+                lower_lines.append(line_lower.strip())
         
-        if document_type == 'aadhaar_card':
-            data.update(self._extract_aadhaar_fields(text_lines))
-        elif 'marksheet' in document_type:
-            data.update(self._extract_marksheet_fields(text_lines))
-        else:
-            # Generic extraction for other document types
-            data.update(self._extract_generic_fields(text_lines))
+        extract_fields = self._field_extractors.get(document_type)
+        if extract_fields is None:
+            # Any other marksheet variant still gets marksheet extraction
+            if document_type and 'marksheet' in document_type:
+                extract_fields = self._extract_marksheet_fields
+            else:
+                extract_fields = self._extract_generic_fields
+        data.update(extract_fields(text_lines, lower_lines, text_lower))
         
         # Add extraction metadata
         data['_extraction_method'] = 'fallback_ocr'
-        data['_raw_text'] = text[:500] + "..." if len(text) > 500 else text
+        if self.keep_raw_text:
+            data['_raw_text'] = text[:500] + "..." if len(text) > 500 else text
         
         return data
     
-    def _extract_aadhaar_fields(self, lines: List[str]) -> Dict[str, Any]:
+    def _extract_aadhaar_fields(self, lines: List[str], lower_lines: List[str], text_lower: str) -> Dict[str, Any]:
         """Extract Aadhaar card specific fields"""
         data = {}
         
-        # Look for patterns in text lines
+        # Name extraction (usually the largest text at top)
         for line in lines:
-            line_lower = line.lower()
-            
-            # Name extraction (usually the largest text at top)
-            if len(line) > 10 and any(char.isalpha() for char in line):
-                if 'name' not in data:
-                    data['name'] = line.strip()
-            
-            # Aadhaar number (12 digits with spaces)
-            import re
-            aadhaar_match = re.search(r'\b\d{4}\s*\d{4}\s*\d{4}\b', line)
-            if aadhaar_match:
-                data['aadhaar_number'] = aadhaar_match.group().replace(' ', '')
-            
-            # Date of birth
-            dob_match = re.search(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{4}\b', line)
-            if dob_match:
-                data['date_of_birth'] = dob_match.group()
+            if len(line) > 10 and _LETTER_RE.search(line):
+                data['name'] = line
+                break
+        
+        # Aadhaar number (12 digits with spaces) and date of birth in one pass;
+        # later lines win, as with the previous line-by-line scan
+        for field, match in _scan_fields(_AADHAAR_FIELDS_RE, text_lower):
+            if field == 'aadhaar_number':
+                data['aadhaar_number'] = match.group().replace(' ', '')
+            else:
+                data['date_of_birth'] = match.group()
         
         return data
     
-    def _extract_marksheet_fields(self, lines: List[str]) -> Dict[str, Any]:
+    def _extract_marksheet_fields(self, lines: List[str], lower_lines: List[str], text_lower: str) -> Dict[str, Any]:
         """Extract marksheet specific fields"""
         data = {}
         
-        for line in lines:
-            line_lower = line.lower()
-            
-            # Student name (often appears after "name" keyword)
+        for line, line_lower in zip(lines, lower_lines):
+            # Student name (often appears after "name" keyword); the first match is
+            # the student's, later ones are parents' names, so stop there
             if 'name' in line_lower and len(line) > 10:
-                data['student_name'] = line.replace('name', '').replace(':', '').strip()
-            
-            # Roll number
-            import re
-            roll_match = re.search(r'roll\s*(?:no|number)?[:\s]*([A-Z0-9]+)', line_lower)
-            if roll_match:
-                data['roll_number'] = roll_match.group(1)
-            
-            # Year
-            year_match = re.search(r'\b(20\d{2})\b', line)
-            if year_match:
-                data['year'] = year_match.group(1)
+                data['student_name'] = _NAME_LABEL_RE.sub('', line, count=1).strip()
+                break
+        
+        # Roll number and year in one pass over the document; later lines win
+        for field, match in _scan_fields(_MARKSHEET_FIELDS_RE, text_lower):
+            if field == 'roll_number':
+                data['roll_number'] = match.group('roll_value')
+            else:
+                data['year'] = match.group('year')
         
         return data
     
-    def _extract_generic_fields(self, lines: List[str]) -> Dict[str, Any]:
+    def _extract_generic_fields(self, lines: List[str], lower_lines: List[str], text_lower: str) -> Dict[str, Any]:
         """Generic field extraction for unknown document types"""
         data = {}
         
-        # Extract potential names (lines with alphabetic characters)
-        names = [line for line in lines if len(line) > 5 and any(char.isalpha() for char in line)]
+        # Extract potential names (lines with alphabetic characters); stop after the first 3
+        names = list(islice(
+            (line for line in lines if len(line) > 5 and _LETTER_RE.search(line)), 3
+        ))
         if names:
-            data['extracted_text_lines'] = names[:3]  # First 3 text lines
-        
-        # Extract numbers
-        import re
-        numbers = []
-        for line in lines:
-            number_matches = re.findall(r'\b\d{4,}\b', line)
-            numbers.extend(number_matches)
+            data['extracted_text_lines'] = names
         
+        # Extract numbers; numbers never span lines, so scan the whole text and stop after 5
+        numbers = [match.group() for match in islice(_NUMBER_RE.finditer(text_lower), 5)]
         if numbers:
-            data['extracted_numbers'] = numbers[:5]  # First 5 numbers
+            data['extracted_numbers'] = numbers
         
         return data
     
@@ -153,6 +412,6 @@ class FallbackOCR:
             'document_type': document_type
         }
 
-def create_fallback_ocr() -> FallbackOCR:
+def create_fallback_ocr(keep_raw_text: bool = None, tessdata_dir: str = None) -> FallbackOCR:
     """Factory function to create fallback OCR"""
-    return FallbackOCR()
\ No newline at end of file
+    return FallbackOCR(keep_raw_text=keep_raw_text, tessdata_dir=tessdata_dir)
\ No newline at end of file
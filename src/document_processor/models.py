@@ -4,9 +4,25 @@ Request and response models for the microservice
 """
 
 from typing import Dict, Any, List, Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from datetime import datetime
 
+# Document Type Mapping
+DOCUMENT_TYPE_MAPPING = {
+    'AadharCard': 'aadhaar_card',
+    'MarkSheet10': 'marksheet_10th',
+    'MarkSheet12': 'marksheet_12th',
+    'TransferCertificate': 'transfer_certificate',
+    'MigrationCertificate': 'migration_certificate',
+    'EntranceScorecard': 'entrance_scorecard',
+    'AdmitCard': 'admit_card',
+    'CasteCertificate': 'caste_certificate',
+    'DomicileCertificate': 'domicile_certificate',
+}
+
+# Accepted extensions for local test documents
+VALID_DOCUMENT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf', '.webp')
+
 class ProcessDocumentRequest(BaseModel):
     """Request model for /process-doc endpoint"""
     studentId: str = Field(..., min_length=1, max_length=50, description="Unique student identifier")
@@ -14,62 +30,49 @@ class ProcessDocumentRequest(BaseModel):
     cloudinaryUrl: Optional[str] = Field(None, description="Cloudinary URL of the document image")
     documentPath: Optional[str] = Field(None, description="Local file path for testing (alternative to cloudinaryUrl)")
     
-    @validator('docType')
+    @field_validator('docType')
+    @classmethod
     def validate_doc_type(cls, v):
-        # Define supported document types mapping
-        supported_types = {
-            'AadharCard': 'aadhaar_card',
-            'MarkSheet10': 'marksheet_10th',
-            'MarkSheet12': 'marksheet_12th',
-            'TransferCertificate': 'transfer_certificate',
-            'MigrationCertificate': 'migration_certificate',
-            'EntranceScorecard': 'entrance_scorecard',
-            'AdmitCard': 'admit_card',
-            'CasteCertificate': 'caste_certificate',
-            'DomicileCertificate': 'domicile_certificate',
-        }
-        
-        if v not in supported_types:
-            raise ValueError(f'Unsupported document type. Supported types: {list(supported_types.keys())}')
+        if v not in DOCUMENT_TYPE_MAPPING:
+            raise ValueError(f'Unsupported document type. Supported types: {list(DOCUMENT_TYPE_MAPPING)}')
         return v
     
-    @validator('cloudinaryUrl')
-    def validate_cloudinary_url(cls, v, values):
+    @field_validator('cloudinaryUrl')
+    @classmethod
+    def validate_cloudinary_url(cls, v):
         if v is not None and not v.startswith('https://res.cloudinary.com'):
             raise ValueError('Invalid Cloudinary URL format')
         return v
     
-    @validator('documentPath')
-    def validate_document_path(cls, v, values):
+    @field_validator('documentPath')
+    @classmethod
+    def validate_document_path(cls, v):
         """Validate local document path if provided"""
         if v is not None:
             # Check if it's a relative path starting with assets/test_docs
             if not v.startswith('assets/test_docs/'):
                 raise ValueError('Document path must start with assets/test_docs/')
             # Check file extension
-            valid_extensions = ['.jpg', '.jpeg', '.png', '.pdf', '.webp']
-            if not any(v.lower().endswith(ext) for ext in valid_extensions):
-                raise ValueError(f'Invalid file extension. Supported: {valid_extensions}')
+            if not v.lower().endswith(VALID_DOCUMENT_EXTENSIONS):
+                raise ValueError(f'Invalid file extension. Supported: {list(VALID_DOCUMENT_EXTENSIONS)}')
         return v
     
-    @validator('documentPath', always=True)
-    def validate_either_url_or_path(cls, v, values):
+    @model_validator(mode='after')
+    def validate_either_url_or_path(self):
         """Ensure either cloudinaryUrl or documentPath is provided, but not both"""
-        cloudinary_url = values.get('cloudinaryUrl')
-        if cloudinary_url is None and v is None:
+        if self.cloudinaryUrl is None and self.documentPath is None:
             raise ValueError('Either cloudinaryUrl or documentPath must be provided')
-        if cloudinary_url is not None and v is not None:
+        if self.cloudinaryUrl is not None and self.documentPath is not None:
             raise ValueError('Provide either cloudinaryUrl or documentPath, not both')
-        return v
+        return self
     
-    class ConfigDict:
-        json_schema_extra = {
-            "example": {
-                "studentId": "12345",
-                "docType": "AadharCard",
-                "documentPath": "assets/test_docs/aadhaar_sample.jpg"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "studentId": "12345",
+            "docType": "AadharCard",
+            "documentPath": "assets/test_docs/aadhaar_sample.jpg"
         }
+    })
 
 class ProcessedDocumentResponse(BaseModel):
     """Response model for processed document"""
@@ -88,26 +91,25 @@ class ProcessDocumentResponse(BaseModel):
     savedDocument: ProcessedDocumentResponse = Field(..., description="Details of the saved document")
     message: str = Field(default="Document processed successfully", description="Response message")
     
-    class ConfigDict:
-        json_schema_extra = {
-            "example": {
-                "success": True,
-                "studentId": "12345",
-                "savedDocument": {
-                    "docType": "AadharCard",
-                    "documentPath": "assets/test_docs/aadhaar_sample.jpg",
-                    "fields": {
-                        "Name": "Sanjan Acharya",
-                        "DOB": "2002-06-15",
-                        "Address": "Bangalore, Karnataka"
-                    },
-                    "processedAt": "2025-09-27T18:45:00Z",
-                    "confidence": 0.95,
-                    "validationIssues": []
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "success": True,
+            "studentId": "12345",
+            "savedDocument": {
+                "docType": "AadharCard",
+                "documentPath": "assets/test_docs/aadhaar_sample.jpg",
+                "fields": {
+                    "Name": "Sanjan Acharya",
+                    "DOB": "2002-06-15",
+                    "Address": "Bangalore, Karnataka"
                 },
-                "message": "Document processed successfully"
-            }
+                "processedAt": "2025-09-27T18:45:00Z",
+                "confidence": 0.95,
+                "validationIssues": []
+            },
+            "message": "Document processed successfully"
         }
+    })
 
 class ErrorResponse(BaseModel):
     """Error response model"""
@@ -131,19 +133,6 @@ class StudentDocumentsResponse(BaseModel):
     createdAt: datetime = Field(..., description="Student record creation date")
     updatedAt: datetime = Field(..., description="Last update timestamp")
 
-# Document Type Mapping
-DOCUMENT_TYPE_MAPPING = {
-    'AadharCard': 'aadhaar_card',
-    'MarkSheet10': 'marksheet_10th',
-    'MarkSheet12': 'marksheet_12th',
-    'TransferCertificate': 'transfer_certificate',
-    'MigrationCertificate': 'migration_certificate',
-    'EntranceScorecard': 'entrance_scorecard',
-    'AdmitCard': 'admit_card',
-    'CasteCertificate': 'caste_certificate',
-    'DomicileCertificate': 'domicile_certificate',
-}
-
 def get_internal_doc_type(external_doc_type: str) -> str:
     """Convert external document type to internal schema type"""
     return DOCUMENT_TYPE_MAPPING.get(external_doc_type, 'other')
\ No newline at end of file
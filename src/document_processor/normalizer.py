@@ -3,11 +3,56 @@ Field Normalization for Document Types
 Standardizes extracted fields across different document types
 """
 
+from datetime import date, datetime
+from functools import lru_cache
 from typing import Dict, Any, Optional
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Normalized field names that hold a person or institution name
+_NAME_FIELDS = frozenset({'Name', 'FatherName', 'MotherName', 'SchoolName', 'BoardName'})
+
+# Accepted spellings for standardized gender values
+_MALE_VALUES = frozenset({'m', 'male'})
+_FEMALE_VALUES = frozenset({'f', 'female'})
+
+_MARKSHEET_TYPES = frozenset({'marksheet_10th', 'marksheet_12th'})
+
+# Exact date layouts tried before falling back to regex extraction
+_DATE_FORMATS = ('%d-%m-%Y', '%d/%m/%Y', '%Y-%m-%d')
+
+# Month names (full and abbreviated) -> zero-padded month number
+_MONTH_NUMBERS = {
+    'january': '01', 'jan': '01',
+    'february': '02', 'feb': '02',
+    'march': '03', 'mar': '03',
+    'april': '04', 'apr': '04',
+    'may': '05',
+    'june': '06', 'jun': '06',
+    'july': '07', 'jul': '07',
+    'august': '08', 'aug': '08',
+    'september': '09', 'sep': '09',
+    'october': '10', 'oct': '10',
+    'november': '11', 'nov': '11',
+    'december': '12', 'dec': '12',
+}
+
+# Patterns compiled once at import; these run for every extracted field
+_NON_DIGIT_RE = re.compile(r'\D')
+_NUMBER_RE = re.compile(r'(\d+\.?\d*)')
+_NAME_CONNECTOR_RE = re.compile(r'\b(?:Of|The|And)\b')
+_DATE_PATTERNS = (
+    re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})'),  # DD/MM/YYYY or DD-MM-YYYY
+    re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})'),  # YYYY/MM/DD or YYYY-MM-DD
+    re.compile(r'(\d{1,2})\s+(\w+)\s+(\d{4})'),        # DD Month YYYY
+)
+_SUBJECT_MARKS_PATTERNS = (
+    re.compile(r'(\w+(?:\s+\w+)*):?\s*(\d+)', re.IGNORECASE),  # Subject: 95 or Subject 95
+    re.compile(r'(\w+(?:\s+\w+)*)\s*-\s*(\d+)', re.IGNORECASE),  # Subject - 95
+)
+
 # Field mapping rules for each document type
 FIELD_MAPPINGS = {
     'aadhaar_card': {
@@ -206,16 +251,12 @@ def normalize_fields(raw_fields: Dict[str, Any], doc_type: str) -> Dict[str, Any
         logger.warning(f"No field mapping found for document type: {doc_type}")
         return raw_fields
     
-    mapping = FIELD_MAPPINGS[doc_type]
     normalized = {}
     
     # Apply field name normalization
     for raw_key, value in raw_fields.items():
-        # Convert to lowercase for matching
-        raw_key_lower = raw_key.lower().replace(' ', '_').replace('-', '_')
-        
         # Find normalized field name
-        normalized_key = mapping.get(raw_key_lower, raw_key)  # Use original if no mapping found
+        normalized_key = _resolve_field_name(doc_type, raw_key)
         
         # Apply value normalization based on field type
         normalized_value = _normalize_field_value(normalized_key, value, doc_type)
@@ -225,7 +266,7 @@ def normalize_fields(raw_fields: Dict[str, Any], doc_type: str) -> Dict[str, Any
     # Apply post-processing rules
     normalized = _apply_post_processing_rules(normalized, doc_type)
     
-    logger.info(f"Normalized {len(raw_fields)} fields to {len(normalized)} for {doc_type}")
+    logger.debug("Normalized %d fields to %d for %s", len(raw_fields), len(normalized), doc_type)
     return normalized
 
 def _normalize_field_value(field_name: str, value: Any, doc_type: str) -> Any:
@@ -236,44 +277,72 @@ def _normalize_field_value(field_name: str, value: Any, doc_type: str) -> Any:
     # Convert to string for processing
     str_value = str(value).strip()
     
+    field_kind = _get_field_kind(field_name)
+    
     # Date normalization (DD/MM/YYYY or DD-MM-YYYY)
-    if any(date_field in field_name.lower() for date_field in ['dob', 'date']):
+    if field_kind == 'date':
         return _normalize_date(str_value)
     
     # Phone number normalization
-    if 'mobile' in field_name.lower() or 'phone' in field_name.lower():
+    if field_kind == 'phone':
         return _normalize_phone_number(str_value)
     
     # Aadhaar number normalization
-    if 'aadhaar' in field_name.lower() and 'number' in field_name.lower():
+    if field_kind == 'aadhaar':
         return _normalize_aadhaar_number(str_value)
     
     # Percentage normalization
-    if 'percentage' in field_name.lower():
+    if field_kind == 'percentage':
         return _normalize_percentage(str_value)
     
     # Name normalization
-    if field_name in ['Name', 'FatherName', 'MotherName', 'SchoolName', 'BoardName']:
+    if field_kind == 'name':
         return _normalize_name(str_value)
     
     return str_value
 
+@lru_cache(maxsize=1024)
+def _resolve_field_name(doc_type: str, raw_key: str) -> str:
+    """
+    Map a raw field name to its normalized name (cached per document type and name)
+    
+    Gemini returns the same keys for every document of a type, so across a batch
+    each key is canonicalized and looked up once rather than once per document.
+    """
+    # Convert to lowercase for matching
+    raw_key_lower = raw_key.lower().replace(' ', '_').replace('-', '_')
+    return FIELD_MAPPINGS[doc_type].get(raw_key_lower, raw_key)  # Use original if no mapping found
+
+@lru_cache(maxsize=256)
+def _get_field_kind(field_name: str) -> Optional[str]:
+    """Classify a field name by the value normalizer it needs (cached per name)"""
+    name_lower = field_name.lower()
+    
+    if 'dob' in name_lower or 'date' in name_lower:
+        return 'date'
+    if 'mobile' in name_lower or 'phone' in name_lower:
+        return 'phone'
+    if 'aadhaar' in name_lower and 'number' in name_lower:
+        return 'aadhaar'
+    if 'percentage' in name_lower:
+        return 'percentage'
+    if field_name in _NAME_FIELDS:
+        return 'name'
+    return None
+
 def _normalize_date(date_str: str) -> str:
     """Normalize date formats to YYYY-MM-DD"""
-    import re
+    # Remove extra spaces; split/join collapses whitespace runs without the regex engine
+    date_str = ' '.join(date_str.split())
     
-    # Remove extra spaces
-    date_str = re.sub(r'\s+', ' ', date_str.strip())
+    # Fast path: well-formed dates parse directly and are validated on the way
+    parsed = _parse_date(date_str)
+    if parsed:
+        return parsed.isoformat()
     
     # Try different date patterns
-    patterns = [
-        r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})',  # DD/MM/YYYY or DD-MM-YYYY
-        r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})',  # YYYY/MM/DD or YYYY-MM-DD
-        r'(\d{1,2})\s+(\w+)\s+(\d{4})',        # DD Month YYYY
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, date_str)
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(date_str)
         if match:
             if len(match.group(1)) == 4:  # Year first
                 year, month, day = match.groups()
@@ -285,34 +354,39 @@ def _normalize_date(date_str: str) -> str:
             month = month.zfill(2) if month.isdigit() else month
             
             # Convert month names to numbers
-            month_names = {
-                'january': '01', 'jan': '01',
-                'february': '02', 'feb': '02',
-                'march': '03', 'mar': '03',
-                'april': '04', 'apr': '04',
-                'may': '05',
-                'june': '06', 'jun': '06',
-                'july': '07', 'jul': '07',
-                'august': '08', 'aug': '08',
-                'september': '09', 'sep': '09',
-                'october': '10', 'oct': '10',
-                'november': '11', 'nov': '11',
-                'december': '12', 'dec': '12',
-            }
-            
-            if month.lower() in month_names:
-                month = month_names[month.lower()]
+            month = _MONTH_NUMBERS.get(month.lower(), month)
             
             return f"{year}-{month}-{day}"
     
     return date_str  # Return original if no pattern matches
 
+def _parse_date(date_str: str) -> Optional[date]:
+    """Parse a date in one of the common exact layouts"""
+    # Zero-padded dates, by far the most common, are sliced and built directly;
+    # strptime's format interpreter is only needed for the looser forms
+    if len(date_str) == 10:
+        try:
+            if date_str[4] == '-' and date_str[7] == '-':
+                return date.fromisoformat(date_str)
+            separator = date_str[2]
+            if separator in '-/' and date_str[5] == separator:
+                day, month, year = date_str[:2], date_str[3:5], date_str[6:]
+                if day.isdigit() and month.isdigit() and year.isdigit():
+                    return date(int(year), int(month), int(day))
+        except ValueError:
+            pass
+    
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    return None
+
 def _normalize_phone_number(phone_str: str) -> str:
     """Normalize phone numbers"""
-    import re
-    
     # Remove all non-digit characters
-    digits = re.sub(r'\D', '', phone_str)
+    digits = _NON_DIGIT_RE.sub('', phone_str)
     
     # Handle Indian phone numbers
     if digits.startswith('91') and len(digits) == 12:
@@ -326,10 +400,8 @@ def _normalize_phone_number(phone_str: str) -> str:
 
 def _normalize_aadhaar_number(aadhaar_str: str) -> str:
     """Normalize Aadhaar numbers"""
-    import re
-    
     # Remove all non-digit characters
-    digits = re.sub(r'\D', '', aadhaar_str)
+    digits = _NON_DIGIT_RE.sub('', aadhaar_str)
     
     # Aadhaar should be exactly 12 digits
     if len(digits) == 12:
@@ -340,10 +412,8 @@ def _normalize_aadhaar_number(aadhaar_str: str) -> str:
 
 def _normalize_percentage(percent_str: str) -> Optional[float]:
     """Normalize percentage values"""
-    import re
-    
     # Extract numeric value
-    match = re.search(r'(\d+\.?\d*)', percent_str)
+    match = _NUMBER_RE.search(percent_str)
     if match:
         try:
             value = float(match.group(1))
@@ -355,15 +425,11 @@ def _normalize_percentage(percent_str: str) -> Optional[float]:
 
 def _normalize_name(name_str: str) -> str:
     """Normalize names (proper case)"""
-    import re
-    
     # Remove extra spaces and convert to title case
-    name = re.sub(r'\s+', ' ', name_str.strip()).title()
+    name = ' '.join(name_str.split()).title()
     
     # Handle special cases
-    name = re.sub(r'\bOf\b', 'of', name)
-    name = re.sub(r'\bThe\b', 'the', name)
-    name = re.sub(r'\bAnd\b', 'and', name)
+    name = _NAME_CONNECTOR_RE.sub(lambda m: m.group().lower(), name)
     
     return name
 
@@ -375,13 +441,13 @@ def _apply_post_processing_rules(fields: Dict[str, Any], doc_type: str) -> Dict[
         # Ensure gender is standardized
         if 'Gender' in fields and fields['Gender']:
             gender = fields['Gender'].lower()
-            if gender in ['m', 'male']:
+            if gender in _MALE_VALUES:
                 fields['Gender'] = 'Male'
-            elif gender in ['f', 'female']:
+            elif gender in _FEMALE_VALUES:
                 fields['Gender'] = 'Female'
     
     # Marksheet specific rules
-    elif doc_type in ['marksheet_10th', 'marksheet_12th']:
+    elif doc_type in _MARKSHEET_TYPES:
         # Ensure result is standardized
         if 'Result' in fields and fields['Result']:
             result = fields['Result'].lower()
@@ -399,18 +465,11 @@ def _apply_post_processing_rules(fields: Dict[str, Any], doc_type: str) -> Dict[
 
 def _parse_subjects_string(subjects_str: str) -> Dict[str, Any]:
     """Parse subjects string into structured format"""
-    import re
-    
     subjects = {}
     
     # Try to find subject-marks patterns
-    patterns = [
-        r'(\w+(?:\s+\w+)*):?\s*(\d+)',  # Subject: 95 or Subject 95
-        r'(\w+(?:\s+\w+)*)\s*-\s*(\d+)',  # Subject - 95
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, subjects_str, re.IGNORECASE)
+    for pattern in _SUBJECT_MARKS_PATTERNS:
+        matches = pattern.findall(subjects_str)
         for subject, marks in matches:
             subject = subject.strip().title()
             try:
@@ -8,6 +8,16 @@ import os
 from pathlib import Path
 from PIL import Image, ImageDraw
 
+@pytest.fixture(autouse=True)
+def isolated_extraction_cache(tmp_path, monkeypatch):
+    """Keep extraction cache entries out of the working tree during tests"""
+    monkeypatch.setenv("EXTRACTION_CACHE_DIR", str(tmp_path / "gemini_cache"))
+
+@pytest.fixture
+def extraction_cache_enabled(monkeypatch):
+    """Turn on the opt-in extraction cache"""
+    monkeypatch.setenv("ENABLE_EXTRACTION_CACHE", "true")
+
 @pytest.fixture
 def sample_aadhaar_image():
     """Create a sample Aadhaar card image for testing"""
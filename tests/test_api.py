@@ -4,13 +4,15 @@ Test FastAPI Application
 
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, AsyncMock
 import json
 import io
 from PIL import Image
 
 # Import the app
-from app import app
+import app as app_module
+from app import app, lifespan, resolve_document_type_hint
+from src.document_processor.core import ProcessingResult
 
 client = TestClient(app)
 
@@ -126,6 +128,14 @@ class TestAPI:
         data = response.json()
         assert "message" in data
         assert "Batch processing not implemented" in data["message"]
+    
+    def test_document_type_hint_resolution(self):
+        """Stored types in either naming are used as hints; others are left to detection"""
+        assert resolve_document_type_hint("aadhaar_card") == "aadhaar_card"
+        assert resolve_document_type_hint("MarkSheet10") == "marksheet_10th"
+        assert resolve_document_type_hint("default") is None
+        assert resolve_document_type_hint("passport") is None
+        assert resolve_document_type_hint(None) is None
 
 class TestErrorHandling:
     """Test error handling scenarios"""
@@ -155,4 +165,51 @@ class TestErrorHandling:
             )
         
         assert response.status_code == 500
-        assert "Processing failed" in response.json()["detail"]
\ No newline at end of file
+        assert "Processing failed" in response.json()["detail"]
+
+    @patch('app.download_document_from_uri')
+    @patch('app.processor')
+    def test_batch_failure_reported_per_uri(self, mock_processor, mock_download):
+        """Test one document's exception fails only that URI in a batch"""
+        mock_download.side_effect = ["/tmp/missing_a.jpg", "/tmp/missing_b.jpg"]
+        mock_processor.process_documents_async = AsyncMock(return_value=[
+            ProcessingResult(True, "aadhaar_card", {"name": "John Doe"}, 0.1, [], 0.9, metadata={}),
+            RuntimeError("Gemini unavailable"),
+        ])
+        
+        response = client.post("/api/process/documents", json={
+            "document_uris": ["https://example.com/a.jpg", "https://example.com/b.jpg"]
+        })
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["processed_documents"] == 1
+        assert data["failed_documents"] == 1
+        assert data["results"][1]["error_message"] == "Gemini unavailable"
+
+class TestStartup:
+    """Test application startup"""
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("failing_side", ["processor", "database"])
+    async def test_partial_startup_failure_cleans_up(self, failing_side):
+        """Test a failure on either startup side closes the database and leaves no processor"""
+        db_manager = Mock(connect_db=AsyncMock(), disconnect_db=AsyncMock())
+        create_processor = Mock(return_value=Mock())
+        if failing_side == "processor":
+            create_processor.side_effect = RuntimeError("startup failed")
+        else:
+            db_manager.connect_db.side_effect = RuntimeError("startup failed")
+        
+        with patch('app.get_database', AsyncMock(return_value=db_manager)), \
+             patch('app.create_processor', create_processor), \
+             patch('app.processor', None):
+            with pytest.raises(RuntimeError, match="startup failed"):
+                async with lifespan(app):
+                    pass
+            
+            assert app_module.processor is None
+        
+        create_processor.assert_called_once()
+        db_manager.connect_db.assert_awaited_once()
+        db_manager.disconnect_db.assert_awaited_once()
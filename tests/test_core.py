@@ -4,8 +4,10 @@ Test Core Processor Module
 
 import pytest
 import os
+import time
 from unittest.mock import Mock, patch
-from src.document_processor.core import DocumentProcessor, create_processor
+from src.document_processor.core import DocumentProcessor, create_processor, _RequestRateLimiter
+from src.document_processor.cache import ExtractionCache
 
 class TestDocumentProcessor:
     """Test cases for DocumentProcessor"""
@@ -22,6 +24,14 @@ class TestDocumentProcessor:
             assert processor.model == mock_model
             mock_genai.configure.assert_called_once_with(api_key="test_key_123")
     
+    def test_processor_initialization_with_explicit_model(self):
+        """Test an explicit model name is used without probing alternatives"""
+        with patch('src.document_processor.core.genai') as mock_genai:
+            processor = DocumentProcessor(api_key="test_key", model_name="models/custom-model")
+            
+            assert processor.model_name == "models/custom-model"
+            mock_genai.GenerativeModel.assert_called_once_with("models/custom-model")
+    
     def test_processor_initialization_without_api_key(self):
         """Test processor initialization fails without API key"""
         with pytest.raises(ValueError, match="Gemini API key required"):
@@ -86,6 +96,192 @@ class TestDocumentProcessor:
         assert result.extracted_data["name"] == "JOHN DOE"
         assert result.confidence_score > 0
         assert result.processing_time > 0
+        assert result.metadata["model_used"] == processor.model_name
+
+    @pytest.mark.usefixtures("extraction_cache_enabled")
+    @patch('src.document_processor.core.genai')
+    def test_repeat_document_served_from_cache(self, mock_genai, sample_aadhaar_image):
+        """Test identical document content skips the second Gemini call"""
+        mock_model = Mock()
+        mock_response = Mock()
+        mock_response.text = '{"name": "JOHN DOE", "aadhaar_number": "123456789012"}'
+        mock_model.generate_content.return_value = mock_response
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        processor = DocumentProcessor(api_key="test_key")
+
+        first = processor.process_document(sample_aadhaar_image, "aadhaar_card")
+        second = processor.process_document(sample_aadhaar_image, "aadhaar_card")
+
+        assert mock_model.generate_content.call_count == 1
+        assert second.extracted_data == first.extracted_data
+        assert second.metadata["cache_hit"] is True
+
+    @pytest.mark.usefixtures("extraction_cache_enabled")
+    @patch('src.document_processor.core.genai')
+    def test_detected_type_reused_when_extraction_retried(self, mock_genai, sample_aadhaar_image):
+        """Test a resubmitted document skips type detection after a failed extraction"""
+        mock_model = Mock()
+        mock_model.generate_content.side_effect = [
+            Mock(text="aadhaar_card"),
+            Exception("500 internal error"),
+            Exception("500 internal error"),
+            Exception("500 internal error"),
+            Mock(text='{"name": "JOHN DOE"}'),
+        ]
+        mock_genai.GenerativeModel.return_value = mock_model
+        
+        processor = DocumentProcessor(api_key="test_key")
+        with patch('src.document_processor.core.time.sleep'), \
+                patch.object(processor, '_create_fallback_data', return_value={}):
+            processor.process_document(sample_aadhaar_image)
+            result = processor.process_document(sample_aadhaar_image)
+        
+        assert result.document_type == "aadhaar_card"
+        assert result.extracted_data == {"name": "JOHN DOE"}
+        assert mock_model.generate_content.call_count == 5
+    
+    @patch('src.document_processor.core.genai')
+    def test_image_encoded_once_for_detection_and_extraction(self, mock_genai, sample_aadhaar_image):
+        """Test detection and extraction share one inline blob of the original file"""
+        mock_model = Mock()
+        mock_model.generate_content.side_effect = [
+            Mock(text="aadhaar_card"),
+            Mock(text='{"name": "JOHN DOE"}'),
+        ]
+        mock_genai.GenerativeModel.return_value = mock_model
+        
+        processor = DocumentProcessor(api_key="test_key")
+        processor.process_document(sample_aadhaar_image)
+        
+        detection_part = mock_model.generate_content.call_args_list[0][0][0][1]
+        extraction_part = mock_model.generate_content.call_args_list[1][0][0][1]
+        assert detection_part is extraction_part
+        assert detection_part["mime_type"] == "image/png"
+        with open(sample_aadhaar_image, "rb") as f:
+            assert detection_part["data"] == f.read()
+    
+    @patch('src.document_processor.core.time.sleep')
+    @patch('src.document_processor.core.genai')
+    def test_invalid_json_retried_with_feedback(self, mock_genai, mock_sleep):
+        """Test malformed output is retried with the parse error in the prompt"""
+        mock_model = Mock()
+        mock_model.generate_content.side_effect = [
+            Mock(text='{"name": "JOHN DOE",'),
+            Mock(text='{"name": "JOHN DOE"}'),
+        ]
+        mock_genai.GenerativeModel.return_value = mock_model
+        
+        processor = DocumentProcessor(api_key="test_key")
+        data = processor._extract_with_gemini(Mock(), "aadhaar_card")
+        
+        assert data == {"name": "JOHN DOE"}
+        retry_prompt = mock_model.generate_content.call_args_list[1][0][0][0]
+        assert "Your previous output was invalid" in retry_prompt
+    
+    @patch('src.document_processor.core.genai')
+    def test_fallback_ocr_created_on_first_use(self, mock_genai):
+        """Test fallback OCR is not initialized until it is needed"""
+        mock_genai.GenerativeModel.return_value = Mock()
+        
+        with patch('src.document_processor.core.create_fallback_ocr') as mock_create:
+            processor = DocumentProcessor(api_key="test_key")
+            mock_create.assert_not_called()
+            
+            assert processor.fallback_ocr is processor.fallback_ocr
+            mock_create.assert_called_once()
+    
+    @patch('src.document_processor.core.genai')
+    def test_fallback_ocr_created_once_across_threads(self, mock_genai):
+        """Test concurrent first uses share one fallback OCR instance"""
+        from concurrent.futures import ThreadPoolExecutor
+        mock_genai.GenerativeModel.return_value = Mock()
+        
+        def slow_create(*args, **kwargs):
+            time.sleep(0.05)
+            return Mock()
+        
+        with patch('src.document_processor.core.create_fallback_ocr', side_effect=slow_create) as mock_create:
+            processor = DocumentProcessor(api_key="test_key")
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                instances = list(executor.map(lambda _: processor.fallback_ocr, range(4)))
+        
+        mock_create.assert_called_once()
+        assert all(instance is instances[0] for instance in instances)
+    
+    @pytest.mark.asyncio
+    @patch('src.document_processor.core.genai')
+    async def test_process_documents_async_preserves_order(self, mock_genai):
+        """Test concurrent batch processing returns results in input order"""
+        mock_genai.GenerativeModel.return_value = Mock()
+        processor = DocumentProcessor(api_key="test_key")
+        
+        def fake_process(image_path, document_type=None, file_bytes=None):
+            time.sleep(0.02 if image_path == "first.jpg" else 0)
+            return image_path
+        
+        with patch.object(processor, 'process_document', side_effect=fake_process):
+            results = await processor.process_documents_async(
+                [("first.jpg", None), ("second.jpg", "aadhaar_card")], max_in_flight=2
+            )
+        
+        assert results == ["first.jpg", "second.jpg"]
+    
+    @pytest.mark.asyncio
+    @patch('src.document_processor.core.genai')
+    async def test_untyped_batch_detected_in_one_call(self, mock_genai, sample_aadhaar_image):
+        """Test document types for a batch are detected with a single Gemini call"""
+        mock_model = Mock()
+        mock_model.generate_content.return_value = Mock(text='["aadhaar_card", "marksheet_10th"]')
+        mock_genai.GenerativeModel.return_value = mock_model
+        processor = DocumentProcessor(api_key="test_key")
+        
+        with patch.object(processor, 'process_document', side_effect=lambda path, doc_type, file_bytes=None: doc_type):
+            results = await processor.process_documents_async(
+                [(sample_aadhaar_image, None), (sample_aadhaar_image, None)]
+            )
+        
+        assert results == ["aadhaar_card", "marksheet_10th"]
+        mock_model.generate_content.assert_called_once()
+    
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("extraction_cache_enabled")
+    @patch('src.document_processor.core.genai')
+    async def test_batch_detection_reuses_bytes_and_memoizes_types(self, mock_genai, sample_aadhaar_image, sample_marksheet_image):
+        """Test batch detection hands the read bytes to extraction and feeds the detection cache"""
+        mock_model = Mock()
+        mock_model.generate_content.return_value = Mock(text='["aadhaar_card", "marksheet_10th"]')
+        mock_genai.GenerativeModel.return_value = mock_model
+        processor = DocumentProcessor(api_key="test_key")
+        
+        with patch.object(processor, 'process_document', side_effect=lambda path, doc_type, file_bytes=None: file_bytes):
+            results = await processor.process_documents_async(
+                [(sample_aadhaar_image, None), (sample_marksheet_image, None)]
+            )
+        
+        with open(sample_aadhaar_image, 'rb') as f:
+            assert results[0] == f.read()
+        
+        mock_model.generate_content.reset_mock()
+        mock_model.generate_content.return_value = Mock(text='{"name": "JOHN DOE"}')
+        result = processor.process_document(sample_aadhaar_image)
+        
+        assert result.document_type == "aadhaar_card"
+        mock_model.generate_content.assert_called_once()  # extraction only, no detection
+    
+    @pytest.mark.asyncio
+    @patch('src.document_processor.core.genai')
+    async def test_process_document_multi_type(self, mock_genai):
+        """Test one document is extracted once per candidate type"""
+        mock_genai.GenerativeModel.return_value = Mock()
+        processor = DocumentProcessor(api_key="test_key")
+        
+        with patch.object(processor, 'process_document', side_effect=lambda path, doc_type, file_bytes=None: doc_type):
+            results = await processor.process_document_multi_type(
+                "doc.jpg", ["marksheet_10th", "marksheet_12th"]
+            )
+        
+        assert results == {"marksheet_10th": "marksheet_10th", "marksheet_12th": "marksheet_12th"}
     
     def test_create_processor_factory(self):
         """Test processor factory function"""
@@ -98,6 +294,82 @@ class TestDocumentProcessor:
             assert processor == mock_processor
             mock_processor_class.assert_called_once_with(api_key="test_key", model_name=None)
 
+class TestRequestRateLimiter:
+    """Test Gemini request pacing"""
+    
+    def test_acquire_waits_for_refill_when_empty(self):
+        """Test an empty bucket blocks until a token refills"""
+        limiter = _RequestRateLimiter(requests_per_minute=600)  # one token every 0.1s
+        limiter.tokens = 0
+        
+        start = time.monotonic()
+        limiter.acquire()
+        
+        assert time.monotonic() - start >= 0.09
+        assert limiter.tokens < 1
+    
+    def test_cold_start_allows_only_burst(self):
+        """Test a fresh limiter lets the burst through, then spaces further calls"""
+        limiter = _RequestRateLimiter(requests_per_minute=600, burst=2)  # one token every 0.1s
+        
+        start = time.monotonic()
+        limiter.acquire()
+        limiter.acquire()
+        assert time.monotonic() - start < 0.05
+        
+        limiter.acquire()
+        limiter.acquire()
+        assert time.monotonic() - start >= 0.18
+    
+    def test_default_burst_is_one_request(self):
+        """Test the default bucket never holds more than one token"""
+        limiter = _RequestRateLimiter(requests_per_minute=600)
+        
+        assert limiter.capacity == 1
+        
+        start = time.monotonic()
+        limiter.acquire()
+        limiter.acquire()
+        assert time.monotonic() - start >= 0.09
+
+class TestExtractionCache:
+    """Test the extraction result cache"""
+    
+    def test_recent_entries_served_from_memory(self, tmp_path):
+        """Test a recent entry is returned without touching disk, as a private copy"""
+        cache = ExtractionCache(cache_dir=str(tmp_path), memory_entries=1)
+        cache.set("aa11", {"extracted_data": {"name": "John Doe"}})
+        
+        for entry in tmp_path.rglob("*.json"):
+            entry.unlink()
+        
+        result = cache.get("aa11")
+        assert result == {"extracted_data": {"name": "John Doe"}}
+        result["extracted_data"]["name"] = "changed"
+        assert cache.get("aa11")["extracted_data"]["name"] == "John Doe"
+        
+        cache.set("bb22", {"extracted_data": {}})
+        assert cache.get("aa11") is None  # evicted from memory and gone from disk
+
+    def test_purge_removes_expired_and_oldest_entries(self, tmp_path):
+        """Test purge drops entries past their TTL and the oldest beyond max_entries"""
+        cache = ExtractionCache(cache_dir=str(tmp_path), ttl_days=1, memory_entries=0, max_entries=2)
+        now = time.time()
+        for age_hours, key in ((48, "aa11"), (3, "bb22"), (2, "cc33"), (1, "dd44")):
+            cache.set(key, {"extracted_data": {}})
+            path = cache._entry_path(key)
+            os.utime(path, (now - age_hours * 3600, now - age_hours * 3600))
+        
+        assert cache.purge() == 2
+        assert sorted(path.stem for path in tmp_path.rglob("*.json")) == ["cc33", "dd44"]
+
+    def test_cache_disabled_by_default(self, monkeypatch):
+        """Test the processor writes no cache entries unless explicitly enabled"""
+        monkeypatch.delenv("ENABLE_EXTRACTION_CACHE", raising=False)
+        with patch('src.document_processor.core.genai'):
+            processor = DocumentProcessor(api_key="test_key")
+        assert processor.extraction_cache is None
+
 class TestDataValidation:
     """Test data validation functionality"""
     
@@ -116,6 +388,22 @@ class TestDataValidation:
         assert len(issues) > 0
         assert any("Missing required field" in issue for issue in issues)
     
+    @patch('src.document_processor.core.genai')
+    def test_validation_rules_checked(self, mock_genai):
+        """Test digit and year rules from the schema are applied"""
+        mock_genai.GenerativeModel.return_value = Mock()
+        
+        processor = DocumentProcessor(api_key="test_key")
+        
+        issues = processor._validate_data(
+            {"aadhaar_number": "1234 5678 9012", "mobile_number": "98765"}, "aadhaar_card"
+        )
+        assert not any("aadhaar_number" in issue for issue in issues)
+        assert "mobile_number should be 10 digits, got: 98765" in issues
+        
+        issues = processor._validate_data({"passing_year": "95"}, "marksheet_10th")
+        assert "passing_year should be 4-digit year, got: 95" in issues
+    
     @patch('src.document_processor.core.genai') 
     def test_confidence_calculation(self, mock_genai):
         """Test confidence score calculation"""
@@ -138,4 +426,15 @@ class TestDataValidation:
         # Test with incomplete data
         incomplete_data = {"name": "John Doe"}
         low_confidence = processor._calculate_confidence(incomplete_data, ["Missing field"])
-        assert low_confidence < confidence
\ No newline at end of file
+        assert low_confidence < confidence
+    
+    @patch('src.document_processor.core.genai')
+    def test_parse_json_response_ignores_surrounding_text(self, mock_genai):
+        """Test JSON is located inside prose and markdown fences"""
+        mock_genai.GenerativeModel.return_value = Mock()
+        
+        processor = DocumentProcessor(api_key="test_key")
+        
+        response_text = 'Here is the data:\n```json\n{"name": "John Doe", "marks": {"maths": 95}}\n```\nDone.'
+        data = processor._parse_json_response(response_text)
+        assert data == {"name": "John Doe", "marks": {"maths": 95}}
@@ -0,0 +1,216 @@
+"""
+Test Fallback OCR Module
+"""
+
+import io
+import pytest
+from unittest.mock import Mock, patch
+from src.document_processor.fallback_ocr import FallbackOCR
+
+SAMPLE_AADHAAR_TEXT = """GOVERNMENT OF INDIA
+Name: JOHN DOE
+Date of Birth: 15/08/1995
+1234 5678 9012
+"""
+
+SAMPLE_MARKSHEET_TEXT = """BOARD OF SECONDARY EDUCATION
+Student Name: JANE SMITH
+Roll No: 123456
+Father's Name: ROBERT SMITH
+Passing Year: 2023
+"""
+
+class TestFieldExtraction:
+    """Test pattern-based field extraction from OCR text"""
+    
+    @pytest.fixture
+    def fallback_ocr(self):
+        """Fallback OCR instance (text parsing does not need tesseract)"""
+        return FallbackOCR()
+    
+    def test_aadhaar_fields(self, fallback_ocr):
+        """Test Aadhaar number and DOB extraction"""
+        data = fallback_ocr._extract_fields_from_text(SAMPLE_AADHAAR_TEXT, 'aadhaar_card')
+        
+        assert data['aadhaar_number'] == '123456789012'
+        assert data['date_of_birth'] == '15/08/1995'
+        assert data['name'] == 'GOVERNMENT OF INDIA'
+        assert data['_extraction_method'] == 'fallback_ocr'
+        assert '_raw_text' not in data
+    
+    def test_marksheet_fields(self, fallback_ocr):
+        """Test roll number and year extraction"""
+        data = fallback_ocr._extract_fields_from_text(SAMPLE_MARKSHEET_TEXT, 'marksheet_10th')
+        
+        assert data['roll_number'] == '123456'
+        assert data['year'] == '2023'
+        assert data['student_name'] == 'JANE SMITH'
+    
+    def test_first_match_on_a_line_last_line_wins(self, fallback_ocr):
+        """Test several matches on a line keep the first one, and later lines win"""
+        data = fallback_ocr._extract_fields_from_text(
+            "Session 2022 - 2023\nRoll No: 4411 Old Roll No: 3300\n", 'marksheet_12th'
+        )
+        assert data['year'] == '2022'
+        assert data['roll_number'] == '4411'
+        
+        data = fallback_ocr._extract_fields_from_text(
+            "1234 5678 9012 / 2345 6789 0123\nDOB: 01/02/1990 or 03/04/1991\n", 'aadhaar_card'
+        )
+        assert data['aadhaar_number'] == '123456789012'
+        assert data['date_of_birth'] == '01/02/1990'
+    
+    def test_roll_number_that_is_a_year_is_also_the_year(self, fallback_ocr):
+        """Test overlapping matches of different fields are both found"""
+        data = fallback_ocr._extract_fields_from_text("Roll No: 2019\n", 'marksheet_10th')
+        
+        assert data['roll_number'] == '2019'
+        assert data['year'] == '2019'
+    
+    def test_student_name_is_first_name_line(self, fallback_ocr):
+        """Test later parent name lines do not replace the student's name"""
+        text = "Name: JO\nStudent Name: JANE SMITH\nFather's Name: ROBERT SMITH\nMother's Name: MARY SMITH\n"
+        data = fallback_ocr._extract_fields_from_text(text, 'marksheet_10th')
+        
+        assert data['student_name'] == 'JANE SMITH'
+    
+    def test_roll_number_with_letters_keeps_leading_digits(self, fallback_ocr):
+        """Test alphanumeric roll numbers, in any case, only keep their leading digits"""
+        for text in ("Roll No: 21CS045\n", "roll no: 21cs045\n"):
+            data = fallback_ocr._extract_fields_from_text(text, 'marksheet_10th')
+            assert data['roll_number'] == '21'
+        
+        data = fallback_ocr._extract_fields_from_text("roll no: cs045\nEnrollment ID: 7788\n", 'marksheet_10th')
+        assert 'roll_number' not in data
+    
+    def test_other_marksheet_types_use_marksheet_extraction(self, fallback_ocr):
+        """Test document types containing 'marksheet' are not treated as generic"""
+        data = fallback_ocr._extract_fields_from_text("Roll No: 123456\nPassing Year: 2023\n", 'marksheet')
+        
+        assert data['roll_number'] == '123456'
+        assert data['year'] == '2023'
+        assert 'extracted_numbers' not in data
+    
+    def test_generic_fields(self, fallback_ocr):
+        """Test generic extraction for unknown document types"""
+        data = fallback_ocr._extract_fields_from_text("Certificate No 987654\nIssued to someone", 'other')
+        
+        assert data['extracted_numbers'] == ['987654']
+        assert len(data['extracted_text_lines']) == 2
+    
+    def test_raw_text_preview_opt_in(self):
+        """Test raw OCR text is only attached when requested"""
+        data = FallbackOCR(keep_raw_text=True)._extract_fields_from_text(SAMPLE_AADHAAR_TEXT, 'aadhaar_card')
+        
+        assert data['_raw_text'] == SAMPLE_AADHAAR_TEXT
+    
+    def test_tessdata_dir_selects_lstm_models(self):
+        """Test a custom tessdata directory is passed to tesseract with the LSTM engine"""
+        fallback_ocr = FallbackOCR(tessdata_dir="/opt/tessdata_fast")
+        
+        assert fallback_ocr._tesseract_config == '--tessdata-dir "/opt/tessdata_fast" --oem 1'
+        assert FallbackOCR()._tesseract_config == ''
+
+class TestBatchExtraction:
+    """Test multi-image fallback extraction"""
+    
+    def test_batch_results_in_input_order(self):
+        """Test each image gets its own result, in order"""
+        from PIL import Image
+        
+        fallback_ocr = FallbackOCR()
+        fallback_ocr.available = True
+        # Page text keyed by image width so the fake tesseract can tell pages apart
+        texts = {10: SAMPLE_AADHAAR_TEXT, 20: "Roll No: 42\n2021"}
+        
+        def fake_tesseract(source, config=''):
+            if source.endswith('.txt'):
+                with open(source) as f:
+                    paths = f.read().split()
+            else:
+                paths = [source]
+            return ''.join(texts[Image.open(path).width] + '\f' for path in paths)
+        
+        images = [Image.new('RGB', (10, 10)), Image.new('RGB', (20, 10))]
+        with patch.dict('sys.modules', {'pytesseract': Mock(image_to_string=fake_tesseract)}), \
+                patch('src.document_processor.fallback_ocr._tesseract_version', return_value='5.3.0'):
+            results = fallback_ocr.extract_text_batch(images, 'aadhaar_card')
+        
+        assert results[0]['aadhaar_number'] == '123456789012'
+        assert 'aadhaar_number' not in results[1]
+
+    def test_tesserocr_apis_reused_across_pages(self):
+        """Test in-process Tesseract APIs are created once and reused per page"""
+        from PIL import Image
+        
+        fake_tesserocr = Mock()
+        fake_tesserocr.PyTessBaseAPI.return_value.GetUTF8Text.return_value = SAMPLE_AADHAAR_TEXT
+        
+        images = [Image.new('RGB', (10, 10)) for _ in range(3)]
+        with patch.dict('sys.modules', {'tesserocr': fake_tesserocr}), \
+                patch('src.document_processor.fallback_ocr._TESSEROCR_AVAILABLE', True), \
+                patch('src.document_processor.fallback_ocr._tesseract_version', return_value='5.3.0'), \
+                patch('src.document_processor.fallback_ocr.os.cpu_count', return_value=1):
+            fallback_ocr = FallbackOCR()
+            results = fallback_ocr.extract_text_batch(images, 'aadhaar_card')
+        
+        assert [data['aadhaar_number'] for data in results] == ['123456789012'] * 3
+        fake_tesserocr.PyTessBaseAPI.assert_called_once_with()
+
+class TestImagePreparation:
+    """Test image preprocessing before Tesseract"""
+    
+    def test_prepare_image_grayscale_with_full_contrast(self):
+        """Test images are reduced to one channel and contrast-stretched"""
+        from PIL import Image
+        
+        image = Image.new('RGB', (40, 20), color=(120, 120, 120))
+        image.paste((140, 140, 140), (20, 0, 40, 20))
+        
+        prepared = FallbackOCR._prepare_image(image)
+        
+        assert prepared.mode == 'L'
+        assert prepared.getextrema() == (0, 255)
+    
+    def test_prepare_image_skips_stretch_on_clean_scan(self):
+        """Test pages already spanning black to white are not remapped"""
+        from PIL import Image
+        
+        image = Image.new('L', (40, 20), color=0)
+        image.paste(255, (20, 0, 40, 20))
+        
+        with patch('PIL.ImageOps.autocontrast') as mock_autocontrast:
+            prepared = FallbackOCR._prepare_image(image)
+        
+        mock_autocontrast.assert_not_called()
+        assert prepared.tobytes() == image.tobytes()
+    
+    def test_prepare_image_applies_exif_orientation(self):
+        """Test EXIF-rotated photos are turned upright"""
+        from PIL import Image
+        
+        image = Image.new('RGB', (40, 20))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise
+        image.info['exif'] = exif.tobytes()
+        
+        assert FallbackOCR._prepare_image(image).size == (20, 40)
+    
+    def test_prepare_image_decodes_jpeg_as_grayscale(self, tmp_path):
+        """Test JPEGs are decoded directly to luminance"""
+        from PIL import Image
+        
+        path = tmp_path / "page.jpg"
+        Image.new('RGB', (64, 32), color=(200, 40, 40)).save(path)
+        image = Image.open(path)
+        
+        prepared = FallbackOCR._prepare_image(image)
+        
+        assert prepared.mode == 'L'
+        assert prepared.size == (64, 32)
+        # The caller's image is not reconfigured
+        assert image.mode == 'RGB'
+        
+        in_memory = Image.open(io.BytesIO(path.read_bytes()))
+        assert FallbackOCR._prepare_image(in_memory).mode == 'L'
+        assert in_memory.mode == 'RGB'
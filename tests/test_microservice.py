@@ -266,6 +266,16 @@ class TestFieldNormalization:
         assert normalized["BoardName"] == "CBSE"
         assert normalized["ExamYear"] == "2020"
         assert normalized["Percentage"] == 91.0
+    
+    def test_date_normalization(self):
+        """Test common date layouts normalize to YYYY-MM-DD"""
+        from src.document_processor.normalizer import _normalize_date
+        
+        assert _normalize_date("15-06-2002") == "2002-06-15"
+        assert _normalize_date("15/06/2002") == "2002-06-15"
+        assert _normalize_date("2002-06-15") == "2002-06-15"
+        assert _normalize_date("5/6/2002") == "2002-06-05"
+        assert _normalize_date("15 June 2002") == "2002-06-15"
 
 class TestCloudinaryService:
     """Test Cloudinary service functionality"""